@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from foodgram.db import check_connections
+from rest_framework.permissions import SAFE_METHODS
+
+from . import views
+
+# Each thread keeps its own database connection, so this also bounds the connections of an ASGI process.
+read_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_READ_THREADS, thread_name_prefix='async-read')
+
+
+def _run_isolated(view, request, *args, **kwargs):
+    close_old_connections()
+    check_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def read_async_view(viewset, actions):
+    """
+    Async view for a viewset: safe methods run in the read thread pool with their own
+    database connection instead of Django's single shared sync thread.
+    """
+    view = viewset.as_view(actions)
+    read = sync_to_async(_run_isolated, thread_sensitive=False, executor=read_executor)
+    write = sync_to_async(view, thread_sensitive=True)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read(view, request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    async_view.cls, async_view.actions = viewset, actions
+    return async_view
+
+
+recipe_list = read_async_view(views.RecipeViewSet, {'get': 'list', 'post': 'create'})
+recipe_detail = read_async_view(views.RecipeViewSet, {
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'
+})
+tag_list = read_async_view(views.TagViewSet, {'get': 'list'})
+tag_detail = read_async_view(views.TagViewSet, {'get': 'retrieve'})
+ingredient_list = read_async_view(views.IngredientViewSet, {'get': 'list'})
+ingredient_detail = read_async_view(views.IngredientViewSet, {'get': 'retrieve'})
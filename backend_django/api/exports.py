@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework import renderers
+
+
+class ExportRenderer(renderers.BaseRenderer):
+    """
+    Content negotiation stub: exports are streamed by the view, only errors are rendered here, as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = renderers.JSONRenderer.media_type
+        if data is None:
+            return b''
+        return renderers.JSONRenderer().render(data)
+
+
+class TextExportRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVExportRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONExportRenderer(renderers.JSONRenderer):
+    charset = 'utf-8'
+
+
+class PDFExportRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_txt(user, ingredients, today):
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n'
+        f'Дата: {today:%Y-%m-%d}\n\n'
+    )
+    for number, ingredient in enumerate(ingredients):
+        yield (
+            f'{chr(10) if number else ""}'
+            f'- {ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]})'
+            f' - {ingredient["amount"]}'
+        )
+    yield f'\n\nFoodgram ({today:%Y})'
+
+
+def export_csv(user, ingredients, today):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def export_json(user, ingredients, today):
+    yield '{{"user": {}, "date": "{:%Y-%m-%d}", "ingredients": ['.format(
+        json.dumps(user.get_full_name(), ensure_ascii=False), today
+    )
+    for number, ingredient in enumerate(ingredients):
+        item = {
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }
+        yield (', ' if number else '') + json.dumps(item, ensure_ascii=False)
+    yield ']}'
+
+
+@lru_cache(maxsize=None)
+def pdf_font():
+    pdfmetrics.registerFont(TTFont('ShoppingList', str(settings.SHOPPING_LIST_PDF_FONT)))
+    return 'ShoppingList'
+
+
+def export_pdf(user, ingredients, today):
+    """
+    A4 pages drawn with a compressing canvas; only finished, compressed pages are kept until the document is saved.
+    """
+    def lines():
+        yield f'Список покупок для: {user.get_full_name()}'
+        yield f'Дата: {today:%Y-%m-%d}'
+        yield ''
+        for ingredient in ingredients:
+            yield (
+                f'- {ingredient["ingredient__name"]} '
+                f'({ingredient["ingredient__measurement_unit"]}) - {ingredient["amount"]}'
+            )
+        yield ''
+        yield f'Foodgram ({today:%Y})'
+
+    font, font_size, leading, margin = pdf_font(), 11, 16, 50
+    width, height = A4
+    lines_per_page = (height - 2 * margin) // leading
+    output = io.BytesIO()
+    pdf = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+    text, count = None, 0
+    for line in lines():
+        for wrapped in simpleSplit(line, font, font_size, width - 2 * margin) or ['']:
+            if text is None:
+                text = pdf.beginText(margin, height - margin)
+                text.setFont(font, font_size, leading)
+            text.textLine(wrapped)
+            count += 1
+            if count == lines_per_page:
+                pdf.drawText(text)
+                pdf.showPage()
+                text, count = None, 0
+    if text is not None:
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+    yield output.getvalue()
+
+
+EXPORTERS = {
+    TextExportRenderer.format: export_txt,
+    CSVExportRenderer.format: export_csv,
+    JSONExportRenderer.format: export_json,
+    PDFExportRenderer.format: export_pdf,
+}
@@ -0,0 +1,77 @@
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+
+class Base64ImageField(serializers.ImageField):
+    """
+    Image sent as a base64 string, decoded chunk by chunk into a temporary file.
+
+    Line-wrapped (MIME style) input is accepted: ASCII whitespace is dropped before decoding.
+    """
+    ALLOWED_TYPES = ('jpeg', 'png', 'gif')
+    CHUNK_SIZE = 64 * 1024
+    WHITESPACE = ' \t\n\r\x0b\x0c'
+    STRIP_WHITESPACE = str.maketrans('', '', WHITESPACE)
+    default_error_messages = {
+        'invalid_base64': 'Загрузите корректную картинку в формате base64.',
+        'invalid_type': 'Неподдерживаемый формат картинки.',
+        'too_large': 'Размер картинки не должен превышать {max_size} байт.',
+    }
+
+    def __init__(self, max_size=None, **kwargs):
+        self.max_size = max_size
+        super().__init__(**kwargs)
+
+    def get_max_size(self):
+        return self.max_size or settings.RECIPE_IMAGE_MAX_SIZE
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail('invalid_base64')
+
+        content_type = None
+        start = data.find(';base64,')
+        if start >= 0:
+            content_type = data[:start].replace('data:', '', 1) or None
+            start += len(';base64,')
+        else:
+            start = 0
+
+        end = len(data.rstrip(self.WHITESPACE))
+        length = end - start - sum(data.count(char, start, end) for char in self.WHITESPACE)
+        padding = data.count('=', max(end - 2, start), end)
+        size = length * 3 // 4 - padding
+        max_size = self.get_max_size()
+        if length % 4 or size <= 0:
+            self.fail('invalid_base64')
+        if size > max_size:
+            self.fail('too_large', max_size=max_size)
+
+        file = TemporaryUploadedFile(uuid.uuid4().hex, content_type, size, None)
+        try:
+            pending = ''
+            for position in range(start, end, self.CHUNK_SIZE):
+                # Whitespace shifts the 4-character groups, so the remainder is carried into the next chunk.
+                pending += data[position:min(position + self.CHUNK_SIZE, end)].translate(self.STRIP_WHITESPACE)
+                decodable = len(pending) - len(pending) % 4
+                file.write(base64.b64decode(pending[:decodable], validate=True))
+                pending = pending[decodable:]
+            file.seek(0)
+            with Image.open(file) as image:
+                image_format = (image.format or '').lower()
+        except (binascii.Error, ValueError, OSError):
+            file.close()
+            self.fail('invalid_base64')
+        if image_format not in self.ALLOWED_TYPES:
+            file.close()
+            self.fail('invalid_type')
+
+        file.name = f'{file.name}.{"jpg" if image_format == "jpeg" else image_format}'
+        file.seek(0)
+        return super().to_internal_value(file)
@@ -1,34 +1,55 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, ExpressionWrapper, F, FloatField, OuterRef
 from django_filters.rest_framework import filters, filterset, backends
 from recipes.models import Ingredient, Recipe, Tag
-from django.db import models
+from recipes.search import search_ingredients, search_recipes
 
 User = get_user_model()
 DjangoFilterBackend = backends.DjangoFilterBackend
 
 
 class IngredientFilter(filterset.FilterSet):
-    name = filters.CharFilter(lookup_expr='startswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        # The list shows only the first matches (IngredientViewSet slices it); get_object() needs them all.
+        view = getattr(self.request, 'parser_context', {}).get('view')
+        limit = settings.INGREDIENT_SEARCH_LIMIT if getattr(view, 'action', None) == 'list' else None
+        return search_ingredients(queryset, value, limit)
+
 
 class RecipeFilter(filterset.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
     )
     author = filters.CharFilter(method='filter_author')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_is_in_shopping_cart')
+    max_calories = filters.NumberFilter(method='filter_max_calories', min_value=0)
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(choices=(('popular', 'Популярные'),), method='filter_ordering')
 
     class Meta:
         model = Recipe
         fields = ('tags',)
 
+    @staticmethod
+    def filter_tags(queryset, name, value):
+        if not value:
+            return queryset
+        # A semi-join keeps one row per recipe without a DISTINCT over the whole result.
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'), tag__in=value)
+        ))
+
     def filter_author(self, queryset, name, value):
         if value.isdigit():
             return queryset.filter(**{name: value})
@@ -47,3 +68,20 @@ class RecipeFilter(filterset.FilterSet):
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         return self._filter_is_param(queryset, name, value, param='shopping_cart')
+
+    @staticmethod
+    def filter_max_calories(queryset, name, value):
+        # Per serving, against the stored recipe total.
+        return queryset.filter(
+            calories__lte=ExpressionWrapper(F('servings') * float(value), output_field=FloatField())
+        )
+
+    @staticmethod
+    def filter_search(queryset, name, value):
+        return search_recipes(queryset, value)
+
+    @staticmethod
+    def filter_ordering(queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by(F('popularity__score').desc(nulls_last=True), '-pub_date', '-id')
+        return queryset
@@ -0,0 +1,524 @@
+import asyncio
+import base64
+import binascii
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import uuid
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, reset_queries
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Max
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from PIL import Image
+from rest_framework.test import APIClient
+from foodgram import urls as foodgram_urls
+from recipes import caches
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+
+from api import urls as api_urls
+from api.fields import Base64ImageField
+from api.filters import RecipeFilter
+from api.paginations import KeysetPagination
+from api.profiling import percentile
+from api.serializers import RecipeCreateSerializer
+
+User = get_user_model()
+
+SCENARIOS = {
+    'recipes.create.concurrent': 'concurrent_creates',
+    'recipes.create.large_image': 'large_image_upload',
+    'recipes.list.tags.many': 'many_tags',
+    'recipes.list.popular': 'popular_ordering',
+    'recipes.list.concurrent': 'concurrent_reads',
+}
+
+
+def create_ingredients_max_id(instance, ingredients):
+    """
+    Ingredient rows keyed by max(id) + 1, the allocation recipe creation used before the database assigned the keys.
+    """
+    first_id = (IngredientAmount.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    IngredientAmount.objects.bulk_create([
+        IngredientAmount(
+            id=first_id + number, recipe=instance, ingredient=ingredient.get('id'), amount=ingredient.get('amount')
+        )
+        for number, ingredient in enumerate(ingredients)
+    ])
+
+
+def delay_queries(delay, active):
+    """
+    Execute wrapper that holds every query for `delay` seconds while `active` is set, standing in for a slow database.
+    """
+    def wrapper(execute, sql, params, many, context):
+        if active.is_set():
+            time.sleep(delay)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def async_read_urlconf():
+    """
+    The project URLconf with the async read views in front, as ASYNC_READ_API mounts them.
+    """
+    urlconf = types.ModuleType('benchmark_async_urls')
+    urlconf.urlpatterns = [path('api/', include((api_urls.async_urlpatterns, 'api')))] + foodgram_urls.urlpatterns
+    return urlconf
+
+
+def image_data(size, noise=False):
+    buffer = io.BytesIO()
+    # Random pixels keep the PNG about as large as the raw image.
+    image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)) if noise else Image.new('RGB', size, 'red')
+    image.save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def filter_tags_distinct(queryset, name, value):
+    """
+    The tag join with DISTINCT, the fix for duplicated recipes that the EXISTS semi-join replaced.
+    """
+    if not value:
+        return queryset
+    return queryset.filter(tags__in=value).distinct()
+
+
+def filter_ordering_counted(queryset, name, value):
+    """
+    Favorites and cart additions counted on every request with the score weights, instead of the score table.
+    """
+    if value != 'popular':
+        return queryset
+    return queryset.annotate(
+        live_score=Count('favorite', distinct=True) + 2 * Count('shopping_cart', distinct=True)
+    ).order_by('-live_score', '-pub_date', '-id')
+
+
+class WholeBase64ImageField(Base64ImageField):
+    """
+    Decodes the whole string into memory at once, as the drf-extra-fields field did before the chunked decoder.
+    """
+    def to_internal_value(self, data):
+        encoded = data.split(';base64,')[-1]
+        try:
+            decoded = base64.b64decode(encoded)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        return serializers.ImageField.to_internal_value(self, ContentFile(decoded, name=f'{uuid.uuid4().hex}.png'))
+
+
+class Command(BaseCommand):
+    help = "Benchmark the main API endpoints in-process and write queries, latency and memory to JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per endpoint')
+        parser.add_argument('--output', default='benchmark.json', help='JSON results file')
+        parser.add_argument('--only', nargs='*', default=None, help='Run only these endpoint names, none if empty')
+        parser.add_argument(
+            '--cold', action='store_true', help='Clear the response and catalogue caches before every request'
+        )
+        parser.add_argument(
+            '--deep-page', type=int, default=10000, help='Deep page of the recipe feed, capped at the last page'
+        )
+        parser.add_argument(
+            '--scenarios', nargs='*', default=[], choices=SCENARIOS, help='Also run these scenarios'
+        )
+        parser.add_argument('--writers', type=int, default=8, help='Parallel clients per concurrency scenario')
+        parser.add_argument('--per-writer', type=int, default=20, help='Requests per writer in the create scenario')
+        parser.add_argument(
+            '--image-kib', type=int, default=4096, help='Image size in the large upload scenario'
+        )
+        parser.add_argument('--filter-tags', type=int, default=5, help='Tags in the many tags scenario')
+        parser.add_argument('--clients', type=int, default=32, help='Parallel clients in the read scenario')
+        parser.add_argument('--per-client', type=int, default=10, help='Requests per client in the read scenario')
+        parser.add_argument(
+            '--wsgi-workers', type=int, default=4, help='Sync workers serving the WSGI side of the read scenario'
+        )
+        parser.add_argument('--db-delay', type=float, default=20, help='Milliseconds added to every query, for reads')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('Нужен хотя бы один замер.')
+        user = User.objects.annotate(
+            carts=Count('shopping_cart', distinct=True), follows=Count('subscriber', distinct=True)
+        ).filter(carts__gt=0).order_by('-follows', '-carts').first()
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if user is None or recipe is None or ingredient is None:
+            raise CommandError('Нет данных для замеров, сначала запустите seed_data.')
+
+        anonymous, authenticated = APIClient(), APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        authenticated.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.token, self.authenticated = token.key, authenticated
+        # Capped at the last page, so the reported page is the one measured.
+        last_page = (Recipe.objects.count() - 1) // KeysetPagination.page_size + 1
+        options['deep_page'] = max(min(options['deep_page'], last_page), 2)
+        endpoints = self.endpoints(anonymous, authenticated, recipe, ingredient, options['deep_page'])
+        if options['only'] is not None:
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in options['only']]
+
+        results = dict()
+        self.stdout.write(
+            f'{"endpoint":30} {"status":>6} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"peak KiB":>9}'
+        )
+        for name, client, url, params, headers in endpoints:
+            results[name] = self.measure(client, url, params, headers, options)
+            result = results[name]
+            self.stdout.write(
+                f'{name:30} {result["status"]:>6} {result["queries"]:>7} {result["p50_ms"]:>8.1f} '
+                f'{result["p95_ms"]:>8.1f} {result["p99_ms"]:>8.1f} {result["peak_kib"]:>9.0f}'
+            )
+
+        scenarios = dict()
+        for name in options['scenarios']:
+            scenarios[name] = getattr(self, SCENARIOS[name])(options)
+            for variant, result in scenarios[name].items():
+                values = ' '.join(f'{key}={value}' for key, value in result.items())
+                self.stdout.write(f'{name}[{variant}] {values}')
+
+        report = {'meta': self.meta(options), 'endpoints': results, 'scenarios': scenarios}
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}.'))
+
+    @staticmethod
+    def endpoints(anonymous, authenticated, recipe, ingredient, deep_page):
+        slugs = list(Tag.objects.order_by('id').values_list('slug', flat=True)[:2])
+        # The deep page in both pagination modes: the keyset cursor points at the last recipe of the page before.
+        page_size = KeysetPagination.page_size
+        previous = Recipe.objects.order_by('-pub_date', '-id')[(deep_page - 1) * page_size - 1]
+        deep_cursor = KeysetPagination.encode_cursor(previous)
+        return [
+            ('recipes.list.anonymous', anonymous, '/api/recipes/', {}, {}),
+            ('recipes.list', authenticated, '/api/recipes/', {}, {}),
+            ('recipes.list.tags', authenticated, '/api/recipes/', {'tags': slugs}, {}),
+            ('recipes.list.favorited', authenticated, '/api/recipes/', {'is_favorited': 1}, {}),
+            ('recipes.list.popular', authenticated, '/api/recipes/', {'ordering': 'popular'}, {}),
+            ('recipes.list.keyset', authenticated, '/api/recipes/', {}, {'HTTP_X_PAGINATION': 'keyset'}),
+            ('recipes.search', authenticated, '/api/recipes/', {'search': recipe.name.split()[-1]}, {}),
+            ('recipes.list.deep_page', authenticated, '/api/recipes/', {'page': deep_page}, {}),
+            ('recipes.list.keyset.deep_page', authenticated, '/api/recipes/', {'cursor': deep_cursor}, {}),
+            ('recipes.detail', authenticated, f'/api/recipes/{recipe.id}/', {}, {}),
+            ('tags.list', anonymous, '/api/tags/', {}, {}),
+            ('ingredients.search', anonymous, '/api/ingredients/', {'name': ingredient.name[:2]}, {}),
+            ('users.list', authenticated, '/api/users/', {}, {}),
+            ('users.subscriptions', authenticated, '/api/users/subscriptions/', {'recipes_limit': 3}, {}),
+            ('shopping_cart.download', authenticated, '/api/recipes/download_shopping_cart/', {}, {}),
+        ]
+
+    @staticmethod
+    def request(client, path, params, headers, cold):
+        if cold:
+            cache.clear()
+            caches.catalogue_cache.clear()
+        response = client.get(path, params, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, len(body)
+
+    def measure(self, client, path, params, headers, options):
+        for _ in range(options['warmup']):
+            self.request(client, path, params, headers, options['cold'])
+
+        # Each request resets the query log, so it must start empty for the capture slice to line up.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            tracemalloc.start()
+            response, size = self.request(client, path, params, headers, options['cold'])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        durations = list()
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            self.request(client, path, params, headers, options['cold'])
+            durations.append((time.perf_counter() - started) * 1000)
+        return {
+            'status': response.status_code,
+            'bytes': size,
+            'queries': len(queries),
+            'peak_kib': round(peak / 1024, 1),
+            'mean_ms': round(statistics.mean(durations), 3),
+            'p50_ms': round(percentile(durations, 50), 3),
+            'p95_ms': round(percentile(durations, 95), 3),
+            'p99_ms': round(percentile(durations, 99), 3),
+        }
+
+    def concurrent_creates(self, options):
+        """
+        Recipes posted by parallel authors, with database-assigned ingredient keys and with max(id) + 1.
+        """
+        if connection.vendor == 'sqlite':
+            self.stderr.write(self.style.WARNING(
+                'SQLite serializes writers with a database lock; run this scenario on PostgreSQL.'
+            ))
+        authors = list(User.objects.order_by('id')[:options['writers']])
+        tags = list(Tag.objects.order_by('id').values_list('id', flat=True)[:2])
+        ingredients = list(Ingredient.objects.order_by('id').values_list('id', flat=True)[:5])
+        payload = {
+            'text': 'Описание', 'cooking_time': 10, 'image': image_data((8, 8)), 'tags': tags,
+            'ingredients': [{'id': ingredient, 'amount': 10} for ingredient in ingredients],
+        }
+        results = dict()
+        # Images of rolled back recipes stay on disk, so they go to a directory removed afterwards.
+        media_root = tempfile.mkdtemp()
+        try:
+            # The database-assigned keys run first: explicit keys leave a PostgreSQL sequence behind the table.
+            for variant, allocate in (('database_ids', RecipeCreateSerializer._create_ingredients),
+                                      ('max_id', create_ingredients_max_id)):
+                with override_settings(MEDIA_ROOT=media_root), \
+                        mock.patch.object(RecipeCreateSerializer, '_create_ingredients', staticmethod(allocate)):
+                    results[variant] = self.run_writers(authors, payload, variant, options['per_writer'])
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        return results
+
+    def large_image_upload(self, options):
+        """
+        Peak traced memory of decoding a large image field and of posting a recipe with it, with the chunked decoder
+        and with a whole-string decode. The request peak includes the JSON body, its parsed copy and the test
+        client's copy of the body.
+        """
+        side = int((options['image_kib'] * 1024 / 3) ** 0.5)
+        image = image_data((side, side), noise=True)
+        payload = {
+            'name': 'benchmark large image', 'text': 'Описание', 'cooking_time': 10, 'image': image,
+            'tags': list(Tag.objects.order_by('id').values_list('id', flat=True)[:1]),
+            'ingredients': [{'id': Ingredient.objects.order_by('id').values_list('id', flat=True)[0], 'amount': 10}],
+        }
+        body = json.dumps(payload)
+        image_size = len(image.split(';base64,')[1]) * 3 // 4
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(User.objects.order_by('id').first())
+        results = dict()
+        media_root = tempfile.mkdtemp()
+        try:
+            for variant, field in (('chunked', Base64ImageField()), ('whole', WholeBase64ImageField())):
+                # The first decode imports the PIL plugins.
+                field.to_internal_value(image).close()
+                tracemalloc.start()
+                field.to_internal_value(image).close()
+                _, decode_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                with override_settings(MEDIA_ROOT=media_root), \
+                        mock.patch('api.serializers.schedule_renditions'), \
+                        mock.patch.dict(RecipeCreateSerializer._declared_fields, image=field):
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    response = client.post('/api/recipes/', body, content_type='application/json')
+                    elapsed = time.perf_counter() - started
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                if response.status_code == 201:
+                    Recipe.objects.filter(id=response.data['id']).delete()
+                results[variant] = {
+                    'status': response.status_code,
+                    'image_kib': round(image_size / 1024),
+                    'body_kib': round(len(body) / 1024),
+                    'decode_peak_kib': round(decode_peak / 1024),
+                    'request_peak_kib': round(peak / 1024),
+                    'ms': round(elapsed * 1000, 1),
+                }
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        return results
+
+    def many_tags(self, options):
+        """
+        The recipe list filtered by --filter-tags tags, with the EXISTS semi-join and with a join and DISTINCT.
+        """
+        slugs = list(Tag.objects.order_by('id').values_list('slug', flat=True)[:options['filter_tags']])
+        results = dict()
+        for variant, method in (('exists', RecipeFilter.filter_tags), ('distinct', filter_tags_distinct)):
+            with mock.patch.object(RecipeFilter, 'filter_tags', staticmethod(method)):
+                results[variant] = {
+                    'tags': len(slugs),
+                    **self.measure(self.authenticated, '/api/recipes/', {'tags': slugs}, {}, options),
+                }
+        return results
+
+    def popular_ordering(self, options):
+        """
+        The popular feed ordered by the precomputed score table and by counts aggregated per request.
+        """
+        results = dict()
+        for variant, method in (('score_table', RecipeFilter.filter_ordering), ('counted', filter_ordering_counted)):
+            with mock.patch.object(RecipeFilter, 'filter_ordering', staticmethod(method)):
+                results[variant] = self.measure(
+                    self.authenticated, '/api/recipes/', {'ordering': 'popular'}, {}, options
+                )
+        return results
+
+    @staticmethod
+    def run_writers(authors, payload, variant, per_writer):
+        barrier = threading.Barrier(len(authors))
+        created, failures = list(), list()
+
+        def write(author):
+            # The test client re-raises exceptions caught by any thread; failed requests are counted by status instead.
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(author)
+            try:
+                barrier.wait()
+                for number in range(per_writer):
+                    data = {**payload, 'name': f'benchmark {variant} {author.id} {number}'}
+                    response = client.post('/api/recipes/', data, format='json')
+                    if response.status_code == 201:
+                        created.append(response.data['id'])
+                    else:
+                        failures.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        # Renditions are built by a worker pool after commit and would compete with the writers;
+        # the expected key conflicts are counted below rather than logged one traceback each.
+        with mock.patch('api.serializers.schedule_renditions'), \
+                mock.patch.object(logging.getLogger('django.request'), 'disabled', True):
+            threads = [threading.Thread(target=write, args=(author,)) for author in authors]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        for recipe in Recipe.objects.filter(id__in=created):
+            recipe.delete()
+        return {
+            'writers': len(authors),
+            'created': len(created),
+            'failed': len(failures),
+            'recipes_per_s': round(len(created) / elapsed, 1),
+            'statuses': sorted(set(failures)),
+        }
+
+    def concurrent_reads(self, options):
+        """
+        Authenticated recipe lists from many clients over a slow database: through the WSGI handler with a fixed
+        number of sync workers, and through the ASGI handler with the async read views.
+        """
+        active = threading.Event()
+        wrapper = delay_queries(options['db_delay'] / 1000, active)
+
+        def install(sender, connection, **kwargs):
+            connection.execute_wrappers.append(wrapper)
+
+        connection_created.connect(install, dispatch_uid='benchmark_db_delay')
+        # Connections opened from here on, in every thread, get the delay.
+        connections.close_all()
+        active.set()
+        try:
+            results = {'wsgi': self.run_wsgi_readers(options)}
+            with override_settings(ROOT_URLCONF=async_read_urlconf()):
+                results['asgi'] = asyncio.run(self.run_asgi_readers(options))
+        finally:
+            active.clear()
+            connection_created.disconnect(dispatch_uid='benchmark_db_delay')
+            connections.close_all()
+        return results
+
+    def run_wsgi_readers(self, options):
+        # Requests past the busy workers wait, as they would in the server's backlog.
+        workers = threading.BoundedSemaphore(options['wsgi_workers'])
+        durations, failures = list(), list()
+
+        def read():
+            client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Token {self.token}')
+            try:
+                for _ in range(options['per_client']):
+                    started = time.perf_counter()
+                    with workers:
+                        response = client.get('/api/recipes/')
+                    durations.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200:
+                        failures.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=read) for _ in range(options['clients'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary(durations, failures, time.perf_counter() - started, workers=options['wsgi_workers'])
+
+    async def run_asgi_readers(self, options):
+        durations, failures = list(), list()
+
+        async def read():
+            client = AsyncClient(raise_request_exception=False)
+            for _ in range(options['per_client']):
+                started = time.perf_counter()
+                response = await client.get('/api/recipes/', authorization=f'Token {self.token}')
+                durations.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(read() for _ in range(options['clients'])))
+        return self.summary(durations, failures, time.perf_counter() - started, workers=settings.ASYNC_READ_THREADS)
+
+    @staticmethod
+    def summary(durations, failures, elapsed, **extra):
+        return {
+            **extra,
+            'requests': len(durations),
+            'failed': len(failures),
+            'requests_per_s': round(len(durations) / elapsed, 1),
+            'p50_ms': round(percentile(durations, 50), 1),
+            'p95_ms': round(percentile(durations, 95), 1),
+        }
+
+    @staticmethod
+    def meta(options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'repeat': options['repeat'],
+            'warmup': options['warmup'],
+            'cold': options['cold'],
+            'deep_page': options['deep_page'],
+            'writers': options['writers'],
+            'per_writer': options['per_writer'],
+            'clients': options['clients'],
+            'per_client': options['per_client'],
+            'db_delay_ms': options['db_delay'],
+            'image_kib': options['image_kib'],
+            'filter_tags': options['filter_tags'],
+        }
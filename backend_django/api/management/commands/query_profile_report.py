@@ -0,0 +1,60 @@
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import percentile
+
+
+class Command(BaseCommand):
+    help = "Aggregate the QueryProfilerMiddleware log into per-endpoint percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.QUERY_PROFILER_LOG, help='Profiler log file')
+        parser.add_argument(
+            '--sort', choices=('total', 'db', 'queries'), default='total', help='Order endpoints by this p95'
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Number of endpoints to show')
+        parser.add_argument('--reset', action='store_true', help='Truncate the log after reporting')
+
+    def handle(self, *args, **options):
+        endpoints = defaultdict(list)
+        try:
+            with open(options['path'], encoding='utf-8') as log:
+                for line in log:
+                    record = json.loads(line)
+                    endpoints[record['endpoint']].append(record)
+        except FileNotFoundError:
+            raise CommandError(f'Нет журнала профилировщика: {options["path"]}.')
+
+        sort_key = 'queries' if options['sort'] == 'queries' else f'{options["sort"]}_ms'
+        rows = sorted(
+            endpoints.items(), key=lambda item: percentile([r[sort_key] for r in item[1]], 95), reverse=True
+        )
+        self.stdout.write(
+            f'{"endpoint":40} {"n":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"db p95":>8} {"app p95":>8} {"q p50":>6} {"q max":>6}'
+        )
+        for endpoint, records in rows[:options['limit']]:
+            column = defaultdict(list)
+            for record in records:
+                for key in ('total_ms', 'db_ms', 'app_ms', 'queries'):
+                    if key in record:
+                        column[key].append(record[key])
+            self.stdout.write(
+                f'{endpoint:40} {len(records):>6} {percentile(column["total_ms"], 50):>8.1f} '
+                f'{percentile(column["total_ms"], 95):>8.1f} {percentile(column["total_ms"], 99):>8.1f} '
+                f'{percentile(column["db_ms"], 95):>8.1f} '
+                f'{percentile(column["app_ms"], 95) if column["app_ms"] else 0:>8.1f} '
+                f'{percentile(column["queries"], 50):>6} {max(column["queries"]):>6}'
+            )
+            duplicates = Counter()
+            for record in records:
+                for sql, count in record['duplicates'].items():
+                    duplicates[sql] = max(duplicates[sql], count)
+            for sql, count in duplicates.most_common(1):
+                self.stdout.write(self.style.WARNING(f'    up to {count}x per request: {sql[:200]}'))
+
+        if options['reset']:
+            open(options['path'], 'w').close()
@@ -1,4 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
@@ -6,3 +14,74 @@ class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     max_page_size = 20
     page_query_param = 'page'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination on (pub_date, id), newest first, without COUNT(*) or OFFSET.
+    """
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    cursor_query_param = 'cursor'
+    mode_header = 'X-Pagination'
+    mode = 'keyset'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    @classmethod
+    def is_requested(cls, request):
+        return (
+            cls.cursor_query_param in request.query_params
+            or request.headers.get(cls.mode_header, '').lower() == cls.mode
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, obj_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            pub_date, obj_id = parse_datetime(pub_date), int(obj_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return pub_date, obj_id
+
+    @staticmethod
+    def encode_cursor(obj):
+        return base64.urlsafe_b64encode(f'{obj.pub_date.isoformat()}|{obj.id}'.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-pub_date', '-id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, obj_id = position
+            # The redundant upper bound gives the planner one index range instead of an OR of two plus a sort.
+            queryset = queryset.filter(pub_date__lte=pub_date).filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=obj_id)
+            )
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -0,0 +1,25 @@
+from django.conf import settings
+from rest_framework import exceptions, parsers, status
+
+
+class RequestTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    Reject JSON bodies above DATA_UPLOAD_MAX_MEMORY_SIZE before reading them.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if request is not None and max_size is not None:
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                content_length = 0
+            if content_length > max_size:
+                raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
@@ -0,0 +1,145 @@
+import contextvars
+import json
+import math
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def fingerprint(sql):
+    """
+    SQL without the variable length of IN lists; parameters are already placeholders.
+    """
+    return IN_LIST.sub('(%s, ...)', sql)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.endpoint = None
+        self.queries = Counter()
+        self.db_time = 0.0
+
+    def record(self, sql, duration):
+        self.queries[fingerprint(sql)] += 1
+        self.db_time += duration
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.queries.items() if count > 1}
+
+    def timings(self, finished):
+        timings = {'total': finished - self.started, 'db': self.db_time}
+        if self.view_started is not None:
+            view_finished = self.view_finished or finished
+            # DRF serializes inside the view, so the view's Python time is mostly serializer time.
+            timings['app'] = max(view_finished - self.view_started - self.db_time, 0.0)
+            if self.view_finished is not None:
+                timings['render'] = finished - self.view_finished
+        return timings
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.record(sql, time.perf_counter() - started)
+
+
+def install_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def endpoint_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'view')
+    action = getattr(view_func, 'actions', {}).get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryProfilerMiddleware:
+    """
+    Opt-in (QUERY_PROFILER): per-request SQL count, DB time, duplicated queries and view time,
+    sent as Server-Timing and appended to QUERY_PROFILER_LOG for the query_profile_report command.
+    """
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILER:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Connections opened later, including the async read path's worker threads, get the wrapper too.
+        connection_created.connect(install_wrapper, dispatch_uid='query_profiler')
+
+    def __call__(self, request):
+        for connection in connections.all():
+            install_wrapper(connection)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        timings = profile.timings(time.perf_counter())
+        response['Server-Timing'] = self.server_timing(profile, timings)
+        self.write(request, response, profile, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.endpoint = endpoint_name(request, view_func)
+            profile.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.view_finished = time.perf_counter()
+        return response
+
+    @staticmethod
+    def server_timing(profile, timings):
+        descriptions = {'db': f'{profile.query_count} queries, {len(profile.duplicates)} duplicated'}
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}' + (f';desc="{descriptions[name]}"' if name in descriptions else '')
+            for name, duration in timings.items()
+        )
+
+    @staticmethod
+    def write(request, response, profile, timings):
+        if profile.endpoint is None:
+            return
+        record = {
+            'endpoint': profile.endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': profile.query_count,
+            'duplicates': profile.duplicates,
+            **{f'{name}_ms': round(duration * 1000, 3) for name, duration in timings.items()},
+        }
+        with open(settings.QUERY_PROFILER_LOG, 'a', encoding='utf-8') as log:
+            log.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -1,11 +1,14 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db import transaction, IntegrityError
-from drf_extra_fields.fields import Base64ImageField
+from django.db.models import Exists, F, OuterRef
 from rest_framework import serializers
 
 from users.models import Subscription
-from recipes.models import Ingredient, IngredientAmount, Recipe, Tag, Favorite, ShoppingCart
+from recipes.images import rendition_name, schedule_renditions
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag, Favorite, ShoppingCart, ShoppingCartTotal
 from . import validators
+from .fields import Base64ImageField
 
 User = get_user_model()
 
@@ -44,8 +47,9 @@ class UserGetSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'email', 'username', 'first_name', 'last_name', 'is_subscribed')
 
-    def get_is_subscribed(self, obj):
-        return obj.id in self.context.get('subscribed_users', [])
+    @staticmethod
+    def get_is_subscribed(obj):
+        return getattr(obj, 'is_subscribed', False)
 
 
 class UsersChangePasswordSerializer(serializers.ModelSerializer):
@@ -119,36 +123,84 @@ class TagGetSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
+class ImageRenditionsField(serializers.Field):
+    def __init__(self, renditions, **kwargs):
+        self.renditions = renditions
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def _url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        representation = dict()
+        for rendition in self.renditions:
+            if recipe.renditions_ready:
+                representation[rendition] = self._url(rendition_name(recipe.image.name, rendition))
+                representation[f'{rendition}_webp'] = self._url(
+                    rendition_name(recipe.image.name, rendition, webp=True)
+                )
+            else:
+                representation[rendition] = representation[f'{rendition}_webp'] = self._url(recipe.image.name)
+        return representation
+
+
 class RecipeShortGetSerializer(serializers.ModelSerializer):
+    images = ImageRenditionsField(renditions=('thumbnail',))
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
 class RecipeGetSerializer(serializers.ModelSerializer):
     tags = TagGetSerializer(many=True, read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
-    author = UserGetSerializer(read_only=True)
+    author = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
+    nutrition = serializers.SerializerMethodField(read_only=True)
+
+    images = ImageRenditionsField(renditions=('thumbnail', 'medium'))
+
     class Meta:
         model = Recipe
         fields = (
             'id', 'ingredients', 'tags', 'is_favorited', 'is_in_shopping_cart',
-            'author', 'name', 'image', 'text', 'cooking_time'
+            'author', 'name', 'image', 'images', 'text', 'cooking_time', 'servings', 'nutrition'
         )
 
     @staticmethod
     def get_ingredients(obj):
-        ingredients = IngredientAmount.objects.filter(recipe=obj)
-        return IngredientAmountGetSerializer(ingredients, many=True).data
+        return IngredientAmountGetSerializer(obj.ingredient_list.all(), many=True).data
 
-    def get_is_favorited(self, obj):
-        return obj.id in self.context.get('favorite_recipes', [])
+    @staticmethod
+    def get_author(obj):
+        author = obj.author
+        author.is_subscribed = getattr(obj, 'is_subscribed', False)
+        return UserGetSerializer(author).data
 
-    def get_is_in_shopping_cart(self, obj):
-        return obj.id in self.context.get('shopping_recipes', [])
+    @staticmethod
+    def get_is_favorited(obj):
+        return getattr(obj, 'is_favorited', False)
+
+    @staticmethod
+    def get_is_in_shopping_cart(obj):
+        return getattr(obj, 'is_in_shopping_cart', False)
+
+    @staticmethod
+    def get_nutrition(obj):
+        totals = {field: round(getattr(obj, field), 2) for field in Recipe.objects.totals}
+        return {
+            **totals,
+            'per_serving': {field: round(value / obj.servings, 2) for field, value in totals.items()},
+        }
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -159,7 +211,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('ingredients', 'tags', 'name', 'image', 'text', 'cooking_time')
+        fields = ('ingredients', 'tags', 'name', 'image', 'text', 'cooking_time', 'servings')
         read_only_fields = ('author',)
 
     @staticmethod
@@ -193,25 +245,53 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Время приготовления должно быть больше суток!')
         return cooking_time
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     @staticmethod
-    def _ingredients(instance, ingredients):
-        create_ingredients = list()
-        obj_id = (
-            IngredientAmount.objects.latest('id').id + 1
-            if IngredientAmount.objects.all().exists()
-            else 0
-        )
-        for ingredient in ingredients:
-            kwargs = {
-                'id': obj_id,
-                'recipe': instance,
-                'ingredient': ingredient.get('id'),
-                'amount': ingredient.get('amount'),
-            }
-            create_ingredients.append(IngredientAmount(**kwargs))
-            obj_id += 1
+    def _create_ingredients(instance, ingredients):
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe=instance, ingredient=ingredient.get('id'), amount=ingredient.get('amount'))
+            for ingredient in ingredients
+        ])
 
-        IngredientAmount.objects.bulk_create(create_ingredients)
+    @staticmethod
+    def _update_ingredients(instance, ingredients):
+        new_amounts = {ingredient.get('id').id: ingredient.get('amount') for ingredient in ingredients}
+        current = {obj.ingredient_id: obj for obj in IngredientAmount.objects.filter(recipe=instance)}
+        # Deleted rows reach the cart totals through post_delete; only the bulk writes are left to the caller.
+        old_amounts = {
+            ingredient_id: obj.amount for ingredient_id, obj in current.items() if ingredient_id in new_amounts
+        }
+
+        removed = [obj.id for ingredient_id, obj in current.items() if ingredient_id not in new_amounts]
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+
+        changed = list()
+        for ingredient_id, obj in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != obj.amount:
+                obj.amount = amount
+                changed.append(obj)
+        IngredientAmount.objects.bulk_update(changed, ['amount'])
+
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe=instance, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        ])
+        return old_amounts, new_amounts
+
+    @staticmethod
+    def _update_totals(instance):
+        Recipe.objects.update_totals([instance.id])
+        instance.refresh_from_db(fields=list(Recipe.objects.totals))
 
     @transaction.atomic
     def create(self, validated_data):
@@ -219,9 +299,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         instance = super().create(validated_data)
         instance.tags.set(tags)
-        self._ingredients(instance, ingredients)
-
-        instance.save()
+        self._create_ingredients(instance, ingredients)
+        self._update_totals(instance)
+        schedule_renditions(instance)
         return instance
 
     @transaction.atomic
@@ -234,11 +314,16 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ingredients = validated_data.get('ingredients')
         if ingredients:
             ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self._ingredients(instance, ingredients)
-            instance.save()
+            old_amounts, new_amounts = self._update_ingredients(instance, ingredients)
+            ShoppingCartTotal.objects.change_recipe(instance.id, old_amounts, new_amounts)
+
+        if 'image' in validated_data:
+            instance.renditions_ready = False
+            schedule_renditions(instance)
 
         instance = super().update(instance, validated_data)
+        if ingredients:
+            self._update_totals(instance)
         return instance
 
     def to_representation(self, instance):
@@ -255,19 +340,21 @@ class ShoppingCartDownloadSerializer(serializers.ModelSerializer):
 
 class SubscriberGetSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.IntegerField(source='recipes.count', read_only=True)
 
     class Meta:
         model = User
         fields = ('email', 'username', 'first_name', 'last_name', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'recipes_preview'):
+            return RecipeShortGetSerializer(obj.recipes_preview, many=True).data
+
         request = self.context.get('request')
-        recipes_limit = None
+        recipes_limit = ''
         if request:
-            recipes_limit = request.query_params.get('recipes_limit')
+            recipes_limit = request.query_params.get('recipes_limit', '')
         recipes = obj.recipes.all()
-        if recipes_limit:
+        if recipes_limit.isdigit():
             recipes = recipes[:int(recipes_limit)]
         return RecipeShortGetSerializer(recipes, many=True).data
 
@@ -275,6 +362,7 @@ class SubscriberGetSerializer(serializers.ModelSerializer):
 class FavoriteOrShoppingOrSubscribeCreateSerializer(serializers.ModelSerializer):
     ERRORS_TEXT = {}
 
+    @transaction.atomic
     def create(self, validated_data):
         try:
             self.instance = self.Meta.model.objects.create(**validated_data)
@@ -282,6 +370,7 @@ class FavoriteOrShoppingOrSubscribeCreateSerializer(serializers.ModelSerializer)
             raise serializers.ValidationError({'errors': self.ERRORS_TEXT.get('create')})
         return self.instance
 
+    @transaction.atomic
     def delete(self, validated_data):
         try:
             instance = self.Meta.model.objects.get(**validated_data)
@@ -334,3 +423,131 @@ class SubscriptionCreateSerializer(FavoriteOrShoppingOrSubscribeCreateSerializer
 
     def to_representation(self, instance):
         return SubscriberGetSerializer(instance=instance.author).data
+
+
+class BulkRelationSerializer(serializers.Serializer):
+    """
+    Add or remove links from the current user to many recipes or authors at once.
+    """
+    MAX_ITEMS = 100
+    ERRORS_TEXT = {}
+
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_ITEMS)
+
+    relation = None
+    target_model = Recipe
+    owner_field = 'user'
+    target_field = 'recipe'
+
+    def _targets(self, owner):
+        ids = list(dict.fromkeys(self.validated_data['ids']))
+        linked = self.relation.objects.filter(**{self.owner_field: owner, self.target_field: OuterRef('pk')})
+        found = dict(
+            self.target_model.objects.filter(id__in=ids).annotate(linked=Exists(linked)).values_list('id', 'linked')
+        )
+        return ids, found
+
+    def validate_target(self, owner, target_id):
+        return None
+
+    @transaction.atomic
+    def add(self, owner):
+        ids, found = self._targets(owner)
+        errors = dict()
+        for target_id in ids:
+            if target_id not in found:
+                errors[target_id] = self.ERRORS_TEXT.get('not_found')
+            elif found[target_id]:
+                errors[target_id] = self.ERRORS_TEXT.get('create')
+            else:
+                error = self.validate_target(owner, target_id)
+                if error:
+                    errors[target_id] = error
+        for target_id in self._insert(owner, [target_id for target_id in ids if target_id not in errors]):
+            errors[target_id] = self.ERRORS_TEXT.get('create')
+        return [
+            {'id': target_id, 'errors': errors[target_id]} if target_id in errors
+            else {'id': target_id, 'status': 'created'}
+            for target_id in ids
+        ]
+
+    def _insert(self, owner, target_ids):
+        """
+        Insert the links and return the ids that turned out to be linked already.
+
+        A link added by a concurrent request after the read in `_targets` fails the single INSERT. The links
+        are then saved one by one, so the model signals count exactly the rows this call created.
+        """
+        def link(target_id):
+            return self.relation(**{self.owner_field: owner, f'{self.target_field}_id': target_id})
+
+        try:
+            with transaction.atomic():
+                self.relation.objects.bulk_create([link(target_id) for target_id in target_ids])
+        except IntegrityError:
+            conflicts = list()
+            for target_id in target_ids:
+                try:
+                    with transaction.atomic():
+                        link(target_id).save()
+                except IntegrityError:
+                    conflicts.append(target_id)
+            return conflicts
+        self.added(owner, target_ids)
+        return []
+
+    @transaction.atomic
+    def remove(self, owner):
+        ids, found = self._targets(owner)
+        deleted_ids = [target_id for target_id in ids if found.get(target_id)]
+        if deleted_ids:
+            self.relation.objects.filter(
+                **{self.owner_field: owner, f'{self.target_field}_id__in': deleted_ids}
+            ).delete()
+        return [
+            {'id': target_id, 'status': 'deleted'} if found.get(target_id)
+            else {'id': target_id, 'errors': self.ERRORS_TEXT.get('delete' if target_id in found else 'not_found')}
+            for target_id in ids
+        ]
+
+    def added(self, owner, target_ids):
+        pass
+
+
+class RecipeBulkRelationSerializer(BulkRelationSerializer):
+    counter = None
+
+    def added(self, owner, target_ids):
+        # bulk_create sends no post_save; deletes still reach the counter and cart total signals.
+        if target_ids:
+            Recipe.objects.filter(id__in=target_ids).update(**{self.counter: F(self.counter) + 1})
+
+
+class FavoriteBulkSerializer(RecipeBulkRelationSerializer):
+    ERRORS_TEXT = {**FavoriteCreateSerializer.ERRORS_TEXT, 'not_found': 'Рецепт не найден.'}
+    relation = Favorite
+    counter = 'favorites_count'
+
+
+class ShoppingBulkSerializer(RecipeBulkRelationSerializer):
+    ERRORS_TEXT = {**ShoppingCreateSerializer.ERRORS_TEXT, 'not_found': 'Рецепт не найден.'}
+    relation = ShoppingCart
+    counter = 'in_carts_count'
+
+    def added(self, owner, target_ids):
+        super().added(owner, target_ids)
+        if target_ids:
+            ShoppingCartTotal.objects.add_recipes(owner.id, target_ids)
+
+
+class SubscriptionBulkSerializer(BulkRelationSerializer):
+    ERRORS_TEXT = {**SubscriptionCreateSerializer.ERRORS_TEXT, 'not_found': 'Пользователь не найден.'}
+    relation = Subscription
+    target_model = User
+    owner_field = 'subscriber'
+    target_field = 'author'
+
+    def validate_target(self, owner, target_id):
+        if target_id == owner.id:
+            return self.ERRORS_TEXT.get('validate')
+        return None
@@ -0,0 +1,608 @@
+import base64
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import RequestFactory
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from recipes import caches, search
+from recipes.models import (
+    Favorite, Ingredient, IngredientAmount, Recipe, RecipeScore, ShoppingCart, ShoppingCartTotal, Tag
+)
+from recipes.seeding import DISHES, Seeder
+from users.models import Subscription
+
+from .filters import RecipeFilter
+from .serializers import BulkRelationSerializer
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='Pa55word!',
+        first_name='Имя', last_name='Фамилия'
+    )
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def recipe_payload(tags, amounts, name='Рецепт'):
+    return {
+        'name': name, 'text': 'Описание', 'cooking_time': 10, 'image': image_data(),
+        'tags': [tag.id for tag in tags],
+        'ingredients': [{'id': ingredient.id, 'amount': amount} for ingredient, amount in amounts.items()],
+    }
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+class ProcessLocalCacheTest(SimpleTestCase):
+    """
+    Without a shared cache, version stamps and catalogue payloads expire instead of living until a restart.
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_version_stamps_expire(self):
+        self.assertTrue(caches.is_process_local())
+        version = caches.get_version(caches.INGREDIENTS)
+        self.assertEqual(caches.get_version(caches.INGREDIENTS), version)
+        expired = time.time() + settings.CACHE_LOCAL_VERSION_TIMEOUT + 1
+        with mock.patch('time.time', return_value=expired):
+            self.assertNotEqual(caches.get_version(caches.INGREDIENTS), version)
+
+    def test_local_entries_expire(self):
+        local = caches.LocalCache(timeout=60)
+        local.set('key', 'value')
+        self.assertEqual(local.get('key'), 'value')
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(local.get('key'))
+
+
+class RecipeListQueriesTest(TestCase):
+    """
+    The recipe list reads authors, tags and ingredients from prefetched data: the query count
+    does not depend on the page size.
+    """
+    ANONYMOUS_QUERIES = 4
+    AUTHENTICATED_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        authors = [create_user(f'author{i}') for i in range(3)]
+        tags = [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}') for i in range(3)]
+        ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г') for i in range(5)]
+        for i in range(8):
+            recipe = Recipe.objects.create(
+                author=authors[i % len(authors)], name=f'Рецепт {i}', text='Описание', cooking_time=10,
+                image='recipes/images/test.png'
+            )
+            recipe.tags.set(tags[:i % len(tags) + 1])
+            IngredientAmount.objects.bulk_create([
+                IngredientAmount(recipe=recipe, ingredient=ingredient, amount=10 * (i + 1))
+                for ingredient in ingredients[:i % len(ingredients) + 1]
+            ])
+            if i % 2:
+                Favorite.objects.create(user=cls.reader, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        Subscription.objects.create(subscriber=cls.reader, author=authors[0])
+
+    def setUp(self):
+        cache.clear()
+        caches.catalogue_cache.clear()
+
+    def assert_list_queries(self, client, expected):
+        for limit in (2, 6):
+            with self.subTest(limit=limit), self.assertNumQueries(expected):
+                response = client.get('/api/recipes/', {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_list(self):
+        self.assert_list_queries(APIClient(), self.ANONYMOUS_QUERIES)
+
+    def test_authenticated_list(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assert_list_queries(client, self.AUTHENTICATED_QUERIES)
+
+
+@override_settings(INGREDIENT_SEARCH_LIMIT=5)
+class IngredientSearchTest(TestCase):
+    """
+    The ingredient list is capped at INGREDIENT_SEARCH_LIMIT, detail lookups see every match.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = [Ingredient.objects.create(name=f'мука {i:02}', measurement_unit='г') for i in range(8)]
+        cls.ingredients.append(Ingredient.objects.create(name='рисовая мука', measurement_unit='г'))
+
+    def setUp(self):
+        caches.catalogue_cache.clear()
+
+    def test_list_is_capped(self):
+        with mock.patch.object(search.ingredient_index, 'search', wraps=search.ingredient_index.search) as index:
+            response = APIClient().get('/api/ingredients/', {'name': 'мук'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.data], [f'мука {i:02}' for i in range(5)])
+        if connection.vendor != 'postgresql':
+            index.assert_called_once_with('мук', 5)
+
+    def test_detail_sees_every_match(self):
+        for ingredient in (self.ingredients[7], self.ingredients[8]):
+            response = APIClient().get(f'/api/ingredients/{ingredient.id}/', {'name': 'мук'})
+            self.assertEqual(response.status_code, 200)
+
+
+class RecipeFilterPlansTest(TestCase):
+    """
+    Every combination of RecipeFilter parameters reads the recipe tables through indexes, never a sequential scan.
+    """
+    PAGE_SIZE = 6
+    SEQ_SCAN = {
+        'postgresql': re.compile(r'Seq Scan on (\w+)'),
+        'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING)'),
+    }
+    WATCHED_TABLES = {
+        Recipe._meta.db_table,
+        Recipe.tags.through._meta.db_table,
+        Favorite._meta.db_table,
+        ShoppingCart._meta.db_table,
+        RecipeScore._meta.db_table,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        Seeder(users=50, recipes=500, ingredients=100).run()
+        RecipeScore.objects.recompute(settings.RECIPE_SCORE_HALF_LIFE_DAYS)
+        cls.user = User.objects.filter(favorite__isnull=False, shopping_cart__isnull=False).first()
+        cls.params = {
+            'tags': [('tags', slug) for slug in Tag.objects.order_by('id').values_list('slug', flat=True)[:2]],
+            'author': [('author', Recipe.objects.order_by('id').values_list('author_id', flat=True).first())],
+            'is_favorited': [('is_favorited', 1)],
+            'is_in_shopping_cart': [('is_in_shopping_cart', 1)],
+            'max_calories': [('max_calories', 500)],
+            'search': [('search', DISHES[0])],
+            'ordering': [('ordering', 'popular')],
+        }
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # The seeded tables are small enough for the planner to prefer reading them whole; the check is
+            # whether an index path exists at all.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def explain(self, query):
+        request = Request(RequestFactory().get('/api/recipes/', query))
+        request.user = self.user
+        view = RecipeViewSet(request=request, action='list', format_kwarg=None, kwargs={})
+        return view.filter_queryset(view.get_queryset())[:self.PAGE_SIZE].explain()
+
+    def test_every_filter_is_covered(self):
+        self.assertEqual(set(self.params), set(RecipeFilter.base_filters))
+
+    def test_no_sequential_scans(self):
+        pattern = self.SEQ_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'Query plans of "{connection.vendor}" are not checked.')
+        for size in range(len(self.params) + 1):
+            for names in itertools.combinations(self.params, size):
+                query = [item for name in names for item in self.params[name]]
+                plan = self.explain(query)
+                with self.subTest(filters=', '.join(names) or 'no filters'):
+                    scans = {table for table in pattern.findall(plan) if table in self.WATCHED_TABLES}
+                    self.assertFalse(scans, plan)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeIngredientsTest(TestCase):
+    """
+    Ingredients are written with one bulk_create and updated as a diff that keeps the shopping cart totals.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.shoppers = [create_user(f'shopper{i}') for i in range(2)]
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.flour, cls.sugar, cls.milk, cls.salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г') for name in ('мука', 'сахар', 'молоко', 'соль')
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    @staticmethod
+    def stored_amounts(recipe_id):
+        return dict(IngredientAmount.objects.filter(recipe_id=recipe_id).values_list('ingredient', 'amount'))
+
+    @staticmethod
+    def cart_totals(user):
+        return dict(ShoppingCartTotal.objects.filter(user=user).values_list('ingredient', 'amount'))
+
+    def create_recipe(self, amounts):
+        response = self.client.post('/api/recipes/', recipe_payload([self.tag], amounts), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_create(self):
+        recipe_id = self.create_recipe({self.flour: 200, self.sugar: 50})
+        self.assertEqual(self.stored_amounts(recipe_id), {self.flour.id: 200, self.sugar.id: 50})
+
+    def test_update_adds_changes_and_removes_ingredients(self):
+        recipe_id = self.create_recipe({self.flour: 200, self.sugar: 50, self.salt: 5})
+        for shopper in self.shoppers:
+            client = APIClient()
+            client.force_authenticate(shopper)
+            self.assertEqual(client.post(f'/api/recipes/{recipe_id}/shopping_cart/').status_code, 201)
+        kept_ids = dict(IngredientAmount.objects.filter(
+            recipe_id=recipe_id, ingredient__in=(self.flour, self.salt)
+        ).values_list('ingredient', 'id'))
+
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/',
+            recipe_payload([self.tag], {self.flour: 300, self.milk: 100, self.salt: 5}, name='Новый рецепт'),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        expected = {self.flour.id: 300, self.milk.id: 100, self.salt.id: 5}
+        self.assertEqual(self.stored_amounts(recipe_id), expected)
+        self.assertEqual(
+            dict(IngredientAmount.objects.filter(
+                recipe_id=recipe_id, ingredient__in=(self.flour, self.salt)
+            ).values_list('ingredient', 'id')),
+            kept_ids
+        )
+        for shopper in self.shoppers:
+            self.assertEqual(self.cart_totals(shopper), expected)
+        self.assertEqual(ShoppingCartTotal.objects.expected(), {
+            (shopper.id, ingredient_id): amount
+            for shopper in self.shoppers for ingredient_id, amount in expected.items()
+        })
+
+
+class ShoppingCartExportTest(TestCase):
+    """
+    The shopping list downloads in every format; a failed download is a JSON error whatever format was asked for.
+    """
+    URL = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('shopper')
+        author = create_user('author')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        eggs = Ingredient.objects.create(name='яйца', measurement_unit='шт.')
+        recipe = Recipe.objects.create(author=author, name='Блины', text='Описание', cooking_time=10)
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe=recipe, ingredient=flour, amount=1500),
+            IngredientAmount(recipe=recipe, ingredient=eggs, amount=3),
+        ])
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, export_format):
+        response = self.client.get(self.URL, {'format': export_format})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_txt(self):
+        response, body = self.download('txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], 'Список покупок для: Имя Фамилия')
+        self.assertEqual(lines[3:5], ['- мука (кг) - 1.5', '- яйца (шт.) - 3'])
+
+    def test_csv(self):
+        response, body = self.download('csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(csv.reader(io.StringIO(body.decode()))), [
+            ['name', 'measurement_unit', 'amount'], ['мука', 'кг', '1.5'], ['яйца', 'шт.', '3'],
+        ])
+
+    def test_json(self):
+        response, body = self.download('json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(body)
+        self.assertEqual(data['user'], 'Имя Фамилия')
+        self.assertEqual(data['ingredients'], [
+            {'name': 'мука', 'measurement_unit': 'кг', 'amount': 1.5},
+            {'name': 'яйца', 'measurement_unit': 'шт.', 'amount': 3},
+        ])
+
+    @staticmethod
+    def pdf_text_streams(body):
+        for match in re.finditer(rb'<<([^<>]*)>>\s*stream\r?\n(.*?)endstream', body, re.S):
+            entries, data = match.groups()
+            if b'/ASCII85Decode' in entries:
+                data = base64.a85decode(data.strip(), adobe=True)
+            data = zlib.decompress(data)
+            if b' BT ' in data:
+                yield data
+
+    def test_pdf(self):
+        recipe = Recipe.objects.get()
+        # Enough ingredients for a second page.
+        for number in range(60):
+            ingredient = Ingredient.objects.create(name=f'специя {number:02}', measurement_unit='г')
+            IngredientAmount.objects.create(recipe=recipe, ingredient=ingredient, amount=5)
+
+        response, body = self.download('pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(body.startswith(b'%PDF-'))
+        self.assertTrue(body.rstrip().endswith(b'%%EOF'))
+        pages = list(self.pdf_text_streams(body))
+        self.assertEqual(len(pages), 2)
+        # Title, date, blank line, 62 ingredients, blank line and footer, one line per T* operator.
+        self.assertEqual(sum(page.count(b'T*') for page in pages), 67)
+        self.assertIn(b' - 1.5)', pages[0])
+        self.assertIn(b' 59 ', pages[1])
+        self.assertIn(b' - 3)', pages[1])
+
+    def test_empty_cart_is_json_error(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        for export_format in ('txt', 'csv', 'json', 'pdf'):
+            with self.subTest(export_format=export_format):
+                response, body = self.download(export_format)
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response['Content-Type'].startswith('application/json'))
+                self.assertEqual(json.loads(body), ['В списке покупок нет рецептов.'])
+
+    def test_anonymous_is_json_error(self):
+        self.client.force_authenticate(None)
+        response, body = self.download('pdf')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+        self.assertIn('detail', json.loads(body))
+
+
+class IngredientImportTest(TestCase):
+    """
+    add_ingredients inserts new ingredients and updates the reference data of existing ones.
+    """
+    def import_file(self, suffix, content):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, encoding='utf-8', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        call_command('add_ingredients', path=file.name, stdout=io.StringIO())
+
+    def test_import_reference_data(self):
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=create_user('author'), name='Рецепт', text='Описание', cooking_time=10,
+            image='recipes/images/test.png'
+        )
+        IngredientAmount.objects.create(recipe=recipe, ingredient=flour, amount=200)
+
+        self.import_file('.csv', (
+            'name,measurement_unit,calories,price\n'
+            'мука,г,3.4,0.05\n'
+            'сахар,г,4,\n'
+            'соль,г,-1,\n'
+        ))
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'calories', 'price')),
+            {('мука', 3.4, 0.05), ('сахар', 4.0, None)}
+        )
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.calories, 680)
+
+        self.import_file('.json', json.dumps([
+            {'name': 'мука', 'measurement_unit': 'г', 'proteins': 0.1},
+            {'name': 'молоко', 'measurement_unit': 'мл', 'fats': 0.03},
+        ]))
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'calories', 'proteins', 'fats')),
+            {('мука', 3.4, 0.1, None), ('сахар', 4.0, None, None), ('молоко', None, None, 0.03)}
+        )
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.proteins, 20)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeAuthorCounterTest(TestCase):
+    """
+    recipes_count follows the recipe author through edits by staff and changes of the author.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.other = create_user('other')
+        cls.admin = create_user('admin')
+        cls.admin.is_staff = True
+        cls.admin.save()
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def recipes_counts(self):
+        return dict(User.objects.filter(
+            id__in=(self.author.id, self.other.id, self.admin.id)
+        ).values_list('username', 'recipes_count'))
+
+    def test_staff_update_keeps_author(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.post('/api/recipes/', recipe_payload([self.tag], {self.flour: 100}), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe_id = response.data['id']
+
+        client.force_authenticate(self.admin)
+        response = client.patch(
+            f'/api/recipes/{recipe_id}/', recipe_payload([self.tag], {self.flour: 200}, name='Исправленный рецепт'),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(Recipe.objects.get(id=recipe_id).author_id, self.author.id)
+        self.assertEqual(self.recipes_counts(), {'author': 1, 'other': 0, 'admin': 0})
+
+        self.assertEqual(client.delete(f'/api/recipes/{recipe_id}/').status_code, 204)
+        self.assertEqual(self.recipes_counts(), {'author': 0, 'other': 0, 'admin': 0})
+
+    def test_author_change_moves_counter(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание', cooking_time=10, image='recipes/images/test.png'
+        )
+        self.assertEqual(self.recipes_counts(), {'author': 1, 'other': 0, 'admin': 0})
+
+        recipe.author = self.other
+        recipe.save()
+        self.assertEqual(self.recipes_counts(), {'author': 0, 'other': 1, 'admin': 0})
+
+        recipe.name = 'Другое название'
+        recipe.save()
+        self.assertEqual(self.recipes_counts(), {'author': 0, 'other': 1, 'admin': 0})
+
+        recipe.delete()
+        self.assertEqual(self.recipes_counts(), {'author': 0, 'other': 0, 'admin': 0})
+
+
+class BulkRelationTest(TestCase):
+    """
+    Batch favorite and cart additions count only the rows they insert themselves.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        author = create_user('author')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', text='Описание', cooking_time=10, image='recipes/images/test.png'
+            )
+            for i in range(3)
+        ]
+        for recipe in cls.recipes:
+            IngredientAmount.objects.create(recipe=recipe, ingredient=flour, amount=100)
+
+    def add_racing(self, url, model, raced):
+        """
+        POST the batch while `raced` gets linked between the "already linked" read and the INSERT.
+        """
+        targets = BulkRelationSerializer._targets
+
+        def concurrent_add(serializer, owner):
+            found = targets(serializer, owner)
+            model.objects.create(user=self.user, recipe=raced)
+            return found
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(BulkRelationSerializer, '_targets', concurrent_add):
+            response = client.post(url, {'ids': [recipe.id for recipe in self.recipes]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return {item['id']: item.get('status', 'error') for item in response.data['results']}
+
+    def test_favorite_added_concurrently(self):
+        raced = self.recipes[1]
+        results = self.add_racing('/api/recipes/favorite/', Favorite, raced)
+        self.assertEqual(results, {self.recipes[0].id: 'created', raced.id: 'error', self.recipes[2].id: 'created'})
+        self.assertEqual(
+            list(Recipe.objects.filter(id__in=[recipe.id for recipe in self.recipes]).values_list(
+                'favorites_count', flat=True
+            )),
+            [1, 1, 1]
+        )
+
+    def test_cart_added_concurrently(self):
+        self.add_racing('/api/recipes/shopping_cart/', ShoppingCart, self.recipes[0])
+        self.assertEqual(
+            set(Recipe.objects.filter(id__in=[recipe.id for recipe in self.recipes]).values_list(
+                'in_carts_count', flat=True
+            )),
+            {1}
+        )
+        self.assertEqual(
+            dict(ShoppingCartTotal.objects.filter(user=self.user).values_list('ingredient', 'amount')),
+            {ingredient_id: amount for (_, ingredient_id), amount in ShoppingCartTotal.objects.expected().items()}
+        )
+        self.assertEqual(ShoppingCartTotal.objects.filter(user=self.user).get().amount, 300)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ConcurrentRecipeCreateTest(TransactionTestCase):
+    """
+    Recipes created from several connections at once get their ingredient keys from the database.
+    """
+    WRITERS = 8
+    RECIPES_PER_WRITER = 5
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest('SQLite serializes writers with a database lock.')
+
+    def test_concurrent_creates(self):
+        authors = [create_user(f'writer{i}') for i in range(self.WRITERS)]
+        tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredients = [Ingredient.objects.create(name=f'Ингредиент {i}', measurement_unit='г') for i in range(5)]
+        barrier = threading.Barrier(self.WRITERS)
+        errors = list()
+
+        def write(author):
+            client = APIClient()
+            client.force_authenticate(author)
+            try:
+                barrier.wait()
+                for number in range(self.RECIPES_PER_WRITER):
+                    amounts = {ingredient: number + 1 for ingredient in ingredients}
+                    payload = recipe_payload([tag], amounts, name=f'{author.username} {number}')
+                    response = client.post('/api/recipes/', payload, format='json')
+                    if response.status_code != 201:
+                        errors.append(response.data)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        # Renditions are built by a worker pool after commit; they are not under test here.
+        with mock.patch('api.serializers.schedule_renditions'):
+            threads = [threading.Thread(target=write, args=(author,)) for author in authors]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        recipes = self.WRITERS * self.RECIPES_PER_WRITER
+        self.assertEqual(Recipe.objects.count(), recipes)
+        self.assertEqual(IngredientAmount.objects.count(), recipes * len(ingredients))
+        self.assertEqual(
+            set(User.objects.filter(id__in=[author.id for author in authors]).values_list('recipes_count', flat=True)),
+            {self.RECIPES_PER_WRITER}
+        )
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 app_name = 'api'
 
@@ -15,3 +16,16 @@ urlpatterns = [
     path('', include(router_v1.urls)),
     path(r'auth/', include('djoser.urls.authtoken')),
 ]
+
+# Public reads served by the async views, for ASGI deployments (ASYNC_READ_API).
+async_urlpatterns = [
+    path('ingredients/', async_views.ingredient_list, name='ingredients-list'),
+    path('ingredients/<int:pk>/', async_views.ingredient_detail, name='ingredients-detail'),
+    path('recipes/', async_views.recipe_list, name='recipes-list'),
+    path('recipes/<int:pk>/', async_views.recipe_detail, name='recipes-detail'),
+    path('tags/', async_views.tag_list, name='tags-list'),
+    path('tags/<int:pk>/', async_views.tag_detail, name='tags-detail'),
+]
+
+if settings.ASYNC_READ_API:
+    urlpatterns = async_urlpatterns + urlpatterns
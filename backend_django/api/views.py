@@ -1,15 +1,20 @@
+import hashlib
 from datetime import datetime
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from foodgram import db
 from rest_framework import viewsets, decorators, response, mixins, status, exceptions
-
+from rest_framework.permissions import SAFE_METHODS
 
 from users import models as models_users
-from recipes import models as models_recipes
+from recipes import caches, models as models_recipes, units
 
-from . import permissions, paginations, serializers, filters
+from . import exports, permissions, paginations, serializers, filters
 
 User = get_user_model()
 
@@ -27,7 +32,76 @@ class PaginateResponse:
         return response.Response(data=serializer.data, status=status.HTTP_200_OK)
 
 
+class BulkRelationMixin:
+    """
+    Add or remove a batch of ids through a BulkRelationSerializer.
+    """
+    def bulk_relation_response(self):
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        if self.request.method == 'POST':
+            results = serializer.add(self.request.user)
+        else:
+            results = serializer.remove(self.request.user)
+        return response.Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class ReplicaReadMixin:
+    """
+    Route safe-method reads of the listed actions to the read replica.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS and self.action in self.replica_actions:
+            self._replica_token = db.use_replica.set(True)
+        super().initial(request, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            token = getattr(self, '_replica_token', None)
+            if token is not None:
+                db.use_replica.reset(token)
+                self._replica_token = None
+
+
+class CatalogueCacheMixin:
+    """
+    Serve read-only catalogue payloads from a version-stamped cache with ETag support.
+    """
+    catalogue = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self):
+        query = sorted(self.request.query_params.lists())
+        return f'{self.catalogue}:{self.action}:{sorted(self.kwargs.items())}:{query}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = caches.get_version(self.catalogue)
+        key = self.get_cache_key()
+        etag = '"{}"'.format(hashlib.md5(f'{version}:{key}'.encode()).hexdigest())
+        if etag in request.headers.get('If-None-Match', ''):
+            return response.Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = caches.catalogue_cache.get((version, key))
+        if data is None:
+            resp = handler(request, *args, **kwargs)
+            if resp.status_code != status.HTTP_200_OK:
+                return resp
+            data = resp.data
+            caches.catalogue_cache.set((version, key), data)
+        return response.Response(data=data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+
 class UserViewSet(PaginateResponse,
+                  BulkRelationMixin,
                   mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
                   mixins.ListModelMixin,
@@ -43,26 +117,23 @@ class UserViewSet(PaginateResponse,
             return serializers.UsersCreateSerializer
         elif self.action in ('subscribe',):
             return serializers.SubscriptionCreateSerializer
+        elif self.action in ('subscribe_bulk',):
+            return serializers.SubscriptionBulkSerializer
         elif self.action in ('subscriptions',):
             return serializers.SubscriberGetSerializer
         elif self.action in ('set_password',):
             return serializers.UsersChangePasswordSerializer
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        if self.request.user.is_anonymous or self.action not in ('list', 'retrieve'):
-            return context
-
-        data = {'subscriber': self.get_user()}
-        if self.kwargs:
-            data['author'] = self.get_object()
-
-        add_context_data = {
-            'subscribed_users': models_users.Subscription,
-        }
-        for name, model in add_context_data.items():
-            context[name] = set(model.objects.filter(**data).values_list('author_id', flat=True))
-        return context
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.get_user()
+        if user.is_authenticated and self.action in ('list', 'retrieve'):
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    models_users.Subscription.objects.filter(subscriber=user, author=OuterRef('pk'))
+                )
+            )
+        return queryset
 
     def get_user(self):
         return self.request.user
@@ -106,6 +177,13 @@ class UserViewSet(PaginateResponse,
         elif self.request.method == 'DELETE':
             return self._delete_subscribe(data)
 
+    @decorators.action(
+        methods=['post', 'delete'], detail=False, url_path='subscribe', url_name='subscribe_bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def subscribe_bulk(self, request, *args, **kwargs):
+        return self.bulk_relation_response()
+
     def _create_subscribe(self, data):
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
@@ -122,22 +200,76 @@ class UserViewSet(PaginateResponse,
         permission_classes=[permissions.IsAuthenticated], pagination_class=paginations.CustomPagination
     )
     def subscriptions(self, request, *args, **kwargs):
-        instance = self.get_user()
-        subscriptions = instance.subscriber.all()
+        recipes = models_recipes.Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        if recipes_limit.isdigit():
+            recipes = recipes.filter(id__in=Subquery(
+                models_recipes.Recipe.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).values('id')[:int(recipes_limit)]
+            ))
         subscribers = User.objects.filter(
-            id__in=subscriptions.values('author'),
+            following__subscriber=self.get_user(),
+        ).order_by('id').prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_preview'),
         )
         return self.paginate_response(subscribers)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class AnonymousCacheMixin:
+    """
+    Cache list and retrieve payloads for anonymous users in the shared cache.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self):
+        versions = [caches.TAGS, caches.INGREDIENTS]
+        if self.action == 'retrieve':
+            versions.append(caches.recipe_version_name(self.kwargs.get(self.lookup_field)))
+        else:
+            versions.append(caches.RECIPES)
+        query = sorted((name, sorted(values)) for name, values in self.request.query_params.lists())
+        # The pagination header switches the list payload between page numbers and cursors.
+        keyset = paginations.KeysetPagination.is_requested(self.request)
+        key = (
+            f'{self.action}:{self.request.get_host()}:{self.kwargs}:{query}:{keyset}:'
+            f'{caches.get_versions(*versions)}'
+        )
+        return 'recipe_response:{}'.format(hashlib.md5(key.encode()).hexdigest())
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_cache_key()
+        data = cache.get(key)
+        if data is not None:
+            caches.count(caches.RESPONSE_HITS)
+            resp = response.Response(data=data, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'})
+        else:
+            caches.count(caches.RESPONSE_MISSES)
+            resp = handler(request, *args, **kwargs)
+            if resp.status_code == status.HTTP_200_OK:
+                cache.set(key, resp.data, timeout=settings.RECIPE_CACHE_TIMEOUT)
+            resp['X-Cache'] = 'MISS'
+        patch_vary_headers(resp, (paginations.KeysetPagination.mode_header,))
+        return resp
+
+
+class TagViewSet(CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalogue = caches.TAGS
     queryset = models_recipes.Tag.objects.all()
     serializer_class = serializers.TagGetSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
+    catalogue = caches.INGREDIENTS
     queryset = models_recipes.Ingredient.objects.all()
     serializer_class = serializers.IngredientGetSerializer
     permission_classes = (permissions.AllowAny,)
@@ -145,8 +277,18 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = filters.IngredientFilter
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('name'):
+            return queryset[:settings.INGREDIENT_SEARCH_LIMIT]
+        return queryset
+
 
-class RecipeViewSet(PaginateResponse, viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin,
+                    AnonymousCacheMixin,
+                    PaginateResponse,
+                    BulkRelationMixin,
+                    viewsets.ModelViewSet):
     queryset = models_recipes.Recipe.objects.all()
     permission_classes = (permissions.IsOwnerOrAdminOrReadOnly,)
     filter_backends = (filters.DjangoFilterBackend,)
@@ -155,6 +297,46 @@ class RecipeViewSet(PaginateResponse, viewsets.ModelViewSet):
     def get_user(self):
         return self.request.user
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if (
+                self.action == 'list'
+                and paginations.KeysetPagination.is_requested(self.request)
+                and not {'ordering', 'search'} & self.request.query_params.keys()
+            ):
+                self._paginator = paginations.KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+
+        queryset = queryset.select_related('author').prefetch_related(
+            Prefetch(
+                'ingredient_list',
+                queryset=models_recipes.IngredientAmount.objects.select_related('ingredient')
+            ),
+            'tags',
+        )
+        user = self.get_user()
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    models_recipes.Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_in_shopping_cart=Exists(
+                    models_recipes.ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                is_subscribed=Exists(
+                    models_users.Subscription.objects.filter(subscriber=user, author=OuterRef('author'))
+                ),
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return serializers.RecipeGetSerializer
@@ -164,41 +346,18 @@ class RecipeViewSet(PaginateResponse, viewsets.ModelViewSet):
             return serializers.FavoriteCreateSerializer
         elif self.action in ('shopping_cart',):
             return serializers.ShoppingCreateSerializer
+        elif self.action in ('favorite_bulk',):
+            return serializers.FavoriteBulkSerializer
+        elif self.action in ('shopping_cart_bulk',):
+            return serializers.ShoppingBulkSerializer
         elif self.action in ('download_shopping_cart',):
             return serializers.ShoppingCartDownloadSerializer
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        if self.request.user.is_anonymous or self.action not in ('list', 'retrieve'):
-            return context
-
-        data = {'user': self.get_user()}
-        if self.kwargs:
-            data['recipe'] = self.get_object()
-
-        add_context_data = {
-            'favorite_recipes': models_recipes.Favorite,
-            'shopping_recipes': models_recipes.ShoppingCart
-        }
-        for name, model in add_context_data.items():
-            context[name] = set(model.objects.filter(**data).values_list('recipe_id', flat=True))
-
-        data = {
-            'subscriber': self.get_user(),
-        }
-        if self.kwargs:
-            data['author_id'] = self.get_object().author
-
-        context['subscribed_users'] = set(
-            models_users.Subscription.objects.filter(**data).values_list('author_id', flat=True)
-        )
-        return context
-
     def perform_create(self, serializer):
         serializer.save(author=self.get_user())
 
     def perform_update(self, serializer):
-        serializer.save(author=self.get_user())
+        serializer.save()
 
     @decorators.action(
         methods=['delete', 'post'], detail=True, url_path='favorite', url_name='favorite',
@@ -214,6 +373,20 @@ class RecipeViewSet(PaginateResponse, viewsets.ModelViewSet):
     def shopping_cart(self, request, *args, **kwargs):
         return self._favorite_or_shopping_cart_view()
 
+    @decorators.action(
+        methods=['delete', 'post'], detail=False, url_path='favorite', url_name='favorite_bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def favorite_bulk(self, request, *args, **kwargs):
+        return self.bulk_relation_response()
+
+    @decorators.action(
+        methods=['delete', 'post'], detail=False, url_path='shopping_cart', url_name='shopping_cart_bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def shopping_cart_bulk(self, request, *args, **kwargs):
+        return self.bulk_relation_response()
+
     def _favorite_or_shopping_cart_view(self):
         data = {
             'user': self.get_user().id,
@@ -238,39 +411,23 @@ class RecipeViewSet(PaginateResponse, viewsets.ModelViewSet):
     @decorators.action(
         methods=['get'], detail=False,
         url_path='download_shopping_cart', url_name='download_shopping_cart',
-        permission_classes=[permissions.IsAuthenticated]
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=[
+            exports.TextExportRenderer, exports.CSVExportRenderer, exports.JSONExportRenderer, exports.PDFExportRenderer
+        ]
     )
     def download_shopping_cart(self, request, *args, **kwargs):
         user = self.get_user()
         if not user.shopping_cart.exists():
             raise exceptions.ValidationError('В списке покупок нет рецептов.')
 
-        ingredients = models_recipes.IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        filename, shopping_list = self.create_shopping_list(ingredients)
+        ingredients = units.normalized_totals(models_recipes.ShoppingCartTotal.objects.filter(user=user))
 
-        resp = HttpResponse(shopping_list, content_type='text/plain')
-        resp['Content-Disposition'] = f'attachment; filename={filename}'
-        return resp
-
-    def create_shopping_list(self, ingredients):
-        today = datetime.today()
-        user = self.get_user()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
+        renderer = request.accepted_renderer
+        export = exports.EXPORTERS[renderer.format]
+        resp = StreamingHttpResponse(
+            export(user, units.readable(ingredients.iterator()), datetime.today()),
+            content_type=f'{renderer.media_type}; charset=utf-8' if renderer.charset else renderer.media_type
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
-        filename = f'{user.username}_shopping_list.txt'
-        return filename, shopping_list
+        resp['Content-Disposition'] = f'attachment; filename={user.username}_shopping_list.{renderer.format}'
+        return resp
@@ -0,0 +1,47 @@
+import contextvars
+
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+REPLICA = 'replica'
+
+use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica while `use_replica` is set, everything else to default.
+    """
+    def db_for_read(self, model, **hints):
+        if use_replica.get() and REPLICA in connections.databases:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {'default', REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA:
+            return False
+        return None
+
+
+def check_connections():
+    """
+    Close persistent connections that stopped working before they are reused.
+    """
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_HEALTH_CHECKS') and connection.connection is not None:
+            if not connection.is_usable():
+                connection.close()
+
+
+class ConnectionHealthCheckMiddleware(MiddlewareMixin):
+    # A sync-only middleware would run every ASGI request, async views included, on Django's single sync thread.
+    def process_request(self, request):
+        check_connections()
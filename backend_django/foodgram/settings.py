@@ -62,6 +62,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.QueryProfilerMiddleware',
+    'foodgram.db.ConnectionHealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,10 +81,51 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_PAGINATION_CLASS': 'api.paginations.CustomPagination',
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', default=5 * 1024 * 1024))
+
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+
 AUTH_USER_MODEL = 'users.User'
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+# Version stamps in a process-local cache (the LocMemCache default) can not be bumped from other workers or
+# management commands, so they expire after this many seconds. Deployments use the shared memcached instead.
+CACHE_LOCAL_VERSION_TIMEOUT = int(os.getenv('CACHE_LOCAL_VERSION_TIMEOUT', default=30))
+
+CATALOGUE_LOCAL_TIMEOUT = int(os.getenv('CATALOGUE_LOCAL_TIMEOUT', default=60))
+
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', default=2))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=300))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=20))
+
+# A TrueType font with Cyrillic glyphs; the Docker image installs DejaVu Sans from fonts-dejavu-core.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT', default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_SCORE_HALF_LIFE_DAYS = float(os.getenv('RECIPE_SCORE_HALF_LIFE_DAYS', default=7))
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', default='russian')
+
+QUERY_PROFILER = os.getenv('QUERY_PROFILER', default='False').lower() in ('true', '1', 'yes')
+
+QUERY_PROFILER_LOG = os.getenv('QUERY_PROFILER_LOG', default=BASE_DIR / 'query_profile.jsonl')
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SEND_ACTIVATION_EMAIL': False,
@@ -109,27 +152,56 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Route public read endpoints through async views, for ASGI deployments only.
+ASYNC_READ_API = os.getenv('ASYNC_READ_API', default='False').lower() in ('true', '1', 'yes')
+# Threads running those reads per ASGI process, each with its own database connection.
+ASYNC_READ_THREADS = int(os.getenv('ASYNC_READ_THREADS', default=32))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.getenv('DB_NAME', default='default'),
-#         'USER': os.getenv('POSTGRES_USER', default='default'),
-#         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='default'),
-#         'HOST': os.getenv('DB_HOST', default='default'),
-#         'PORT': os.getenv('DB_PORT', default='default')
-#     }
-# }
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR.parent / 'db.sqlite3',
+DB_ENGINE = os.getenv('DB_ENGINE', default='django.db.backends.sqlite3')
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': BASE_DIR.parent / 'db.sqlite3',
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.getenv('DB_NAME', default='default'),
+            'USER': os.getenv('POSTGRES_USER', default='default'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='default'),
+            'HOST': os.getenv('DB_HOST', default='default'),
+            'PORT': os.getenv('DB_PORT', default='default'),
+            # Keep connections open between requests and ping reused ones (see foodgram.db).
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', default='True').lower() in ('true', '1', 'yes'),
+            # Set when connecting through a transaction-pooling PgBouncer.
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+                'DB_DISABLE_SERVER_SIDE_CURSORS', default='False'
+            ).lower() in ('true', '1', 'yes'),
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', default=5)),
+            },
+        }
+    }
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.getenv('DB_REPLICA_HOST'),
+            'PORT': os.getenv('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['foodgram.db.ReplicaRouter']
 
 
 # Password validation
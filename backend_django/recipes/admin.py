@@ -1,11 +1,11 @@
 from django.contrib import admin
 from .models import (
-    Favorite, Ingredient, IngredientAmount, Recipe, ShoppingCart, Tag
+    Favorite, Ingredient, IngredientAmount, Recipe, RecipeScore, ShoppingCart, ShoppingCartTotal, Tag
 )
 
 
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'measurement_unit')
+    list_display = ('name', 'measurement_unit', 'calories', 'price')
     search_fields = ('^name',)
 
 
@@ -23,7 +23,7 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('author', 'name', 'favorited')
+    list_display = ('author', 'name', 'favorited', 'in_carts_count')
     list_filter = ('author', 'name', 'tags')
     exclude = ('ingredients',)
     search_fields = ('^name',)
@@ -32,17 +32,29 @@ class RecipeAdmin(admin.ModelAdmin):
         IngredientAmountInline,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.update_totals([form.instance.id])
+
     @admin.display(empty_value='Никто')
     def favorited(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     favorited.short_description = 'Кол-во людей добавивших в избранное'
 
 
+class RecipeScoreAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'score')
+
+
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
 
 
+class ShoppingCartTotalAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+
+
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
 
@@ -52,4 +64,6 @@ admin.site.register(IngredientAmount, IngredientAmountAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingCartTotal, ShoppingCartTotalAdmin)
 admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(RecipeScore, RecipeScoreAdmin)
@@ -0,0 +1,121 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches as backends
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+
+RESPONSE_HITS = 'recipe_response_hits'
+RESPONSE_MISSES = 'recipe_response_misses'
+
+
+def _version_key(name):
+    return f'catalogue_version:{name}'
+
+
+def is_process_local():
+    """
+    Whether the default cache is private to this process, so other workers and commands can not reach it.
+    """
+    return isinstance(backends[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def _version_timeout():
+    # A bump in a process-local cache never reaches the other processes: let their stamps expire instead.
+    return settings.CACHE_LOCAL_VERSION_TIMEOUT if is_process_local() else None
+
+
+def get_version(name):
+    """
+    Current version stamp of a catalogue, shared by all workers through the cache.
+    """
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=_version_timeout())
+        version = cache.get(key)
+    return version
+
+
+def get_versions(*names):
+    keys = {_version_key(name): name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, uuid.uuid4().hex, timeout=_version_timeout())
+        versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_version(name):
+    cache.set(_version_key(name), uuid.uuid4().hex, timeout=_version_timeout())
+
+
+def recipe_version_name(recipe_id):
+    return f'{RECIPES}:{recipe_id}'
+
+
+def bump_recipe_version(recipe_id):
+    bump_version(RECIPES)
+    bump_version(recipe_version_name(recipe_id))
+
+
+def count(name):
+    key = f'counter:{name}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_counters(*names):
+    values = cache.get_many([f'counter:{name}' for name in names])
+    return {name: values.get(f'counter:{name}', 0) for name in names}
+
+
+def reset_counters(*names):
+    cache.delete_many([f'counter:{name}' for name in names])
+
+
+class LocalCache:
+    """
+    Process-local LRU store for serialized payloads, with entries expiring after `timeout` seconds.
+    """
+    def __init__(self, max_size=256, timeout=None):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout if self.timeout else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+catalogue_cache = LocalCache(timeout=settings.CATALOGUE_LOCAL_TIMEOUT)
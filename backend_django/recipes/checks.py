@@ -0,0 +1,15 @@
+from django.core.checks import Tags, Warning, register
+
+from . import caches
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if not caches.is_process_local():
+        return []
+    return [Warning(
+        'The default cache is private to each process: catalogue and recipe versions bumped by one worker or '
+        'management command reach the others only when their stamps expire.',
+        hint='Point CACHE_BACKEND and CACHE_LOCATION at a shared memcached.',
+        id='recipes.W001',
+    )]
@@ -0,0 +1,88 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import caches
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions/'
+RENDITIONS = {
+    'thumbnail': (320, 320),
+    'medium': (800, 800),
+}
+FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'gif': 'GIF',
+    'webp': 'WEBP',
+}
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_RENDITION_WORKERS, thread_name_prefix='renditions')
+
+
+def rendition_name(image_name, rendition, webp=False):
+    stem, extension = os.path.splitext(os.path.basename(image_name))
+    return f'{RENDITIONS_DIR}{stem}_{rendition}{".webp" if webp else extension.lower()}'
+
+
+def rendition_names(image_name):
+    names = dict()
+    for rendition in RENDITIONS:
+        names[rendition] = rendition_name(image_name, rendition)
+        names[f'{rendition}_webp'] = rendition_name(image_name, rendition, webp=True)
+    return names
+
+
+def _save(name, image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, optimize=True)
+    default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_renditions(recipe):
+    """
+    Write resized, metadata-free copies of the recipe image in its own format and in WebP.
+    """
+    image_name = recipe.image.name
+    image_format = FORMATS.get(os.path.splitext(image_name)[1].lower().lstrip('.'), 'PNG')
+    with default_storage.open(image_name) as file:
+        with Image.open(file) as original:
+            original = ImageOps.exif_transpose(original)
+            original.load()
+    for rendition, size in RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail(size)
+        _save(rendition_name(image_name, rendition), image, image_format)
+        _save(rendition_name(image_name, rendition, webp=True), image, 'WEBP')
+    if Recipe.objects.filter(id=recipe.id, image=image_name).update(renditions_ready=True):
+        caches.bump_recipe_version(recipe.id)
+
+
+def _build_in_worker(recipe_id):
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.filter(id=recipe_id).first()
+        if recipe is not None:
+            build_renditions(recipe)
+    except Exception:
+        logger.exception('Failed to build image renditions for recipe %s', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(recipe):
+    recipe_id = recipe.id
+    transaction.on_commit(lambda: executor.submit(_build_in_worker, recipe_id))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes import caches
+
+
+class CatalogueCommand(BaseCommand):
+    """
+    Command that changes cached data and bumps its version stamps when done.
+    """
+    def bump_versions(self, *names):
+        for name in names:
+            caches.bump_version(name)
+        if caches.is_process_local():
+            self.stdout.write(self.style.WARNING(
+                'The cache is local to this process: running web workers pick up the changes only when their '
+                f'version stamps expire, within {settings.CACHE_LOCAL_VERSION_TIMEOUT}s.'
+            ))
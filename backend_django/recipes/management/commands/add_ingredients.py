@@ -1,17 +1,172 @@
 import csv
+import itertools
+import json
+import math
+import time
+
+from django.core.management.base import CommandError
+from django.db import transaction
 from foodgram.settings import BASE_DIR
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+from recipes import caches
+from recipes.management.base import CatalogueCommand
+from recipes.models import Ingredient, IngredientAmount, Recipe
+
+FIELDS = ('name', 'measurement_unit')
+REFERENCE_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    """
+    Rows as dicts. Columns are named by a header row if there is one, otherwise they follow FIELDS and
+    REFERENCE_FIELDS in order.
+    """
+    columns = FIELDS + REFERENCE_FIELDS
+    for number, row in enumerate(csv.reader(file)):
+        if number == 0 and set(FIELDS) <= {value.strip() for value in row}:
+            columns = tuple(value.strip() for value in row)
+            continue
+        yield dict(zip(columns, row)) if len(row) <= len(columns) else {}
+
+
+def read_json(file, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,' if started else ' \t\r\n')
+        if started and buffer.startswith(']'):
+            return
+        if not started and buffer.startswith('['):
+            started = True
+            buffer = buffer[1:]
+            continue
+        if started and buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                pass
+            else:
+                buffer = buffer[end:]
+                yield item if isinstance(item, dict) else {}
+                continue
+        if eof:
+            raise CommandError('Файл не содержит корректный JSON-массив ингредиентов.')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
 
+def clean_reference_value(value):
+    if isinstance(value, str):
+        value = value.strip() or None
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    value = float(value)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(value)
+    return value
 
-class Command(BaseCommand):
-    help = "Import data to DB from ingredients.csv"
+
+def clean(row):
+    """
+    (name, unit, reference values) of a valid row, or None. Reference values that are missing or blank are
+    left out, so they do not overwrite the stored ones.
+    """
+    name, unit = row.get('name'), row.get('measurement_unit')
+    if not isinstance(name, str) or not isinstance(unit, str):
+        return None
+    name, unit = name.strip(), unit.strip()
+    if not name or not unit or len(name) > NAME_LENGTH or len(unit) > UNIT_LENGTH:
+        return None
+    values = dict()
+    for field in REFERENCE_FIELDS:
+        try:
+            value = clean_reference_value(row.get(field))
+        except (TypeError, ValueError):
+            return None
+        if value is not None:
+            values[field] = value
+    return name, unit, values
+
+
+class Command(CatalogueCommand):
+    help = "Import ingredients with their nutrition and price reference data to DB from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=f'{BASE_DIR.parent}/data/ingredients.csv', help='CSV or JSON file to import'
+        )
+        parser.add_argument('--format', choices=READERS.keys(), help='File format, by default the file extension')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT')
 
     def handle(self, *args, **options):
-        with open(f'{BASE_DIR.parent}/data/ingredients.csv', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader)
-            ingredients = [
-                Ingredient(name=name, measurement_unit=unit) for name, unit in reader
-            ]
-            Ingredient.objects.bulk_create(ingredients)
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}.')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть >= 1.')
+
+        inserted = updated = skipped = total = 0
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = READERS[file_format](file)
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                total += len(batch)
+                created, changed = self.import_batch(batch)
+                inserted += created
+                updated += changed
+                skipped += len(batch) - created - changed
+        self.bump_versions(caches.INGREDIENTS, *((caches.RECIPES,) if updated else ()))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Inserted: {inserted}, updated: {updated}, skipped: {skipped}, '
+            f'{total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else total:.0f} rows/sec).'
+        ))
+
+    @staticmethod
+    @transaction.atomic
+    def import_batch(batch):
+        ingredients = dict()
+        for row in map(clean, batch):
+            if row is not None:
+                name, unit, values = row
+                ingredients.setdefault((name, unit), dict()).update(values)
+        existing = {
+            (obj.name, obj.measurement_unit): obj
+            for obj in Ingredient.objects.filter(name__in={name for name, _ in ingredients})
+        }
+        new_ingredients = [
+            Ingredient(name=name, measurement_unit=unit, **values)
+            for (name, unit), values in ingredients.items()
+            if (name, unit) not in existing
+        ]
+        Ingredient.objects.bulk_create(new_ingredients, ignore_conflicts=True)
+
+        changed = list()
+        for key, values in ingredients.items():
+            obj = existing.get(key)
+            if obj is not None and any(getattr(obj, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(obj, field, value)
+                changed.append(obj)
+        if changed:
+            # bulk_update sends no post_save, so the recipe totals built on this reference data are redone here.
+            Ingredient.objects.bulk_update(changed, REFERENCE_FIELDS)
+            Recipe.objects.update_totals(IngredientAmount.objects.filter(ingredient__in=changed).values('recipe_id'))
+        return len(new_ingredients), len(changed)
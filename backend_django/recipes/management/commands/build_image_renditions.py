@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from recipes.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail, medium and WebP renditions of recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild renditions that are already marked ready')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(renditions_ready=False)
+        built = failed = 0
+        for recipe in recipes.iterator():
+            try:
+                build_renditions(recipe)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Recipe {recipe.id}: {error}')
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f'Built renditions for {built} recipes, failed: {failed}.'))
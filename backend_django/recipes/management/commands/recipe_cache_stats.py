@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from recipes import caches
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the anonymous recipe response cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        counters = caches.get_counters(caches.RESPONSE_HITS, caches.RESPONSE_MISSES)
+        hits, misses = counters[caches.RESPONSE_HITS], counters[caches.RESPONSE_MISSES]
+        ratio = hits / (hits + misses) if hits + misses else 0
+        self.stdout.write(f'Hits: {hits}, misses: {misses}, hit ratio: {ratio:.1%}')
+        if options['reset']:
+            caches.reset_counters(caches.RESPONSE_HITS, caches.RESPONSE_MISSES)
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def count_subquery(model, fk):
+    return Coalesce(Subquery(
+        model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = "Verify or repair the denormalized favorite, shopping cart and recipe counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Overwrite drifted counters with the actual counts')
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for model, field, related, fk in COUNTERS:
+            actual = count_subquery(related, fk)
+            drifted = model.objects.annotate(actual=actual).exclude(**{field: F('actual')}).order_by()
+            if options['fix']:
+                drifted_count = model.objects.filter(pk__in=Subquery(drifted.values('pk'))).update(**{field: actual})
+            else:
+                drifted_count = drifted.count()
+            drifted_total += drifted_count
+            self.stdout.write(f'{model._meta.model_name}.{field}: {drifted_count} drifted')
+
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {drifted_total} counters.'))
+        elif drifted_total:
+            raise CommandError(f'{drifted_total} counters have drifted, run with --fix.')
+        else:
+            self.stdout.write(self.style.SUCCESS('All counters are consistent.'))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import transaction
+from recipes import caches
+from recipes.management.base import CatalogueCommand
+from recipes.models import RecipeScore
+
+
+class Command(CatalogueCommand):
+    help = "Recompute the time-decayed popularity scores behind ?ordering=popular"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life', type=float, default=settings.RECIPE_SCORE_HALF_LIFE_DAYS,
+            help='Days after which a favorite or cart addition counts half'
+        )
+
+    def handle(self, *args, **options):
+        if options['half_life'] <= 0:
+            raise CommandError('Период полураспада должен быть больше нуля.')
+        with transaction.atomic():
+            scored = RecipeScore.objects.recompute(options['half_life'])
+            transaction.on_commit(lambda: self.bump_versions(caches.RECIPES))
+        self.stdout.write(self.style.SUCCESS(f'Scored {scored} recipes.'))
@@ -0,0 +1,12 @@
+from recipes import caches
+from recipes.management.base import CatalogueCommand
+from recipes.search import rebuild_recipe_index
+
+
+class Command(CatalogueCommand):
+    help = "Rebuild the full-text search index of all recipes"
+
+    def handle(self, *args, **options):
+        indexed = rebuild_recipe_index()
+        self.bump_versions(caches.RECIPES)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} recipes.'))
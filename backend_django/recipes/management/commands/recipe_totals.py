@@ -0,0 +1,16 @@
+from recipes import caches
+from recipes.management.base import CatalogueCommand
+from recipes.models import Recipe
+
+
+class Command(CatalogueCommand):
+    help = (
+        "Recompute the stored nutrition and cost totals of all recipes from the ingredient reference data. "
+        "add_ingredients and admin edits already update the recipes they touch; use this after changing "
+        "the data any other way"
+    )
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.update_totals()
+        self.bump_versions(caches.INGREDIENTS, caches.RECIPES)
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} recipes.'))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import CommandError
+from recipes import caches
+from recipes.management.base import CatalogueCommand
+from recipes.seeding import Seeder
+
+
+class Command(CatalogueCommand):
+    help = "Generate synthetic users, recipes, favorites, carts and subscriptions with skewed popularity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='Multiply all volumes below')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500, help='Top up the ingredient catalogue to this size')
+        parser.add_argument('--tags', type=int, default=8, help='Top up the tags to this number')
+        parser.add_argument('--favorites-per-user', type=int, default=10, help='Average, uniform in [0, 2x]')
+        parser.add_argument('--carts-per-user', type=int, default=3, help='Average, uniform in [0, 2x]')
+        parser.add_argument('--subscriptions-per-user', type=int, default=5, help='Average, uniform in [0, 2x]')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of recipe and author popularity')
+        parser.add_argument('--random-seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        if scale <= 0 or options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужны хотя бы два пользователя, один рецепт и положительный масштаб.')
+        seeder = Seeder(
+            users=int(options['users'] * scale),
+            recipes=int(options['recipes'] * scale),
+            ingredients=int(options['ingredients'] * scale),
+            tags=options['tags'],
+            favorites_per_user=options['favorites_per_user'],
+            carts_per_user=options['carts_per_user'],
+            subscriptions_per_user=options['subscriptions_per_user'],
+            skew=options['skew'],
+            random_seed=options['random_seed'],
+        )
+        started = time.perf_counter()
+        created = seeder.run()
+        self.bump_versions(caches.TAGS, caches.INGREDIENTS, caches.RECIPES)
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {name}' for name, count in created.items())
+            + f' in {time.perf_counter() - started:.1f}s.'
+        ))
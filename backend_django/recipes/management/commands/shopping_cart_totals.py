@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = "Verify or rebuild the per-user shopping cart ingredient totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute all totals from shopping carts')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            ShoppingCartTotal.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {ShoppingCartTotal.objects.count()} totals.'))
+            return
+
+        expected = ShoppingCartTotal.objects.expected()
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in ShoppingCartTotal.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).order_by()
+        }
+        mismatches = [
+            (key, expected.get(key), actual.get(key))
+            for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        ]
+        for (user_id, ingredient_id), expected_amount, actual_amount in sorted(mismatches):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: expected {expected_amount}, stored {actual_amount}'
+            )
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} inconsistent totals, run with --rebuild.')
+        self.stdout.write(self.style.SUCCESS(f'{len(actual)} totals are consistent.'))
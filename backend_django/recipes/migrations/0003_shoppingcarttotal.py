@@ -0,0 +1,49 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_totals(apps, schema_editor):
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    rows = IngredientAmount.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values_list(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingCartTotal.objects.bulk_create([
+        ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id, amount=total)
+        for user_id, ingredient_id, total in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_ingredient_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'ordering': ('user', 'ingredient__name'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_total'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='renditions_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Уменьшенные копии картинки готовы'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-18 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_renditions_ready'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        # The implicit tags table is only indexed by (recipe_id, tag_id) and tag_id alone;
+        # filtering by tag needs the recipe ids without touching the table.
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_tags_tag_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.2.7 on 2026-10-18 03:49
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='calories',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Ккал на единицу измерения'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='carbohydrates',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Углеводы (г) на единицу измерения'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='fats',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Жиры (г) на единицу измерения'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='price',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена за единицу измерения'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='proteins',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Белки (г) на единицу измерения'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='calories',
+            field=models.FloatField(default=0, editable=False, verbose_name='Ккал'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbohydrates',
+            field=models.FloatField(default=0, editable=False, verbose_name='Углеводы, г'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='cost',
+            field=models.FloatField(default=0, editable=False, verbose_name='Стоимость'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fats',
+            field=models.FloatField(default=0, editable=False, verbose_name='Жиры, г'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='proteins',
+            field=models.FloatField(default=0, editable=False, verbose_name='Белки, г'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, message='Количество порций должно быть >= 1!')], verbose_name='Количество порций'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.7 on 2026-10-18 04:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+from recipes import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_recipe_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_recipe_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_nutrition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name='Поисковый документ'
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,5 +1,11 @@
+from collections import defaultdict
+from datetime import timedelta
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
 
 from . import validators
 
@@ -26,6 +32,26 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     name = models.CharField(verbose_name='Название', max_length=200, blank=False)
     measurement_unit = models.CharField(verbose_name='Размерность', max_length=20, blank=False)
+    calories = models.FloatField(
+        verbose_name='Ккал на единицу измерения', null=True, blank=True,
+        validators=[validators.MinValueValidator(0)]
+    )
+    proteins = models.FloatField(
+        verbose_name='Белки (г) на единицу измерения', null=True, blank=True,
+        validators=[validators.MinValueValidator(0)]
+    )
+    fats = models.FloatField(
+        verbose_name='Жиры (г) на единицу измерения', null=True, blank=True,
+        validators=[validators.MinValueValidator(0)]
+    )
+    carbohydrates = models.FloatField(
+        verbose_name='Углеводы (г) на единицу измерения', null=True, blank=True,
+        validators=[validators.MinValueValidator(0)]
+    )
+    price = models.FloatField(
+        verbose_name='Цена за единицу измерения', null=True, blank=True,
+        validators=[validators.MinValueValidator(0)]
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -37,11 +63,49 @@ class Ingredient(models.Model):
                 name='unique_ingredient_unit'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_prefix_idx',
+                opclasses=['varchar_pattern_ops']
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeManager(models.Manager):
+    # Stored recipe total -> per-unit reference field of Ingredient.
+    totals = {
+        'calories': 'calories',
+        'proteins': 'proteins',
+        'fats': 'fats',
+        'carbohydrates': 'carbohydrates',
+        'cost': 'price',
+    }
+
+    def get_queryset(self):
+        # The search document is only read by the database: never load it, and never write a stale copy back.
+        return super().get_queryset().defer('search_document')
+
+    def update_totals(self, recipe_ids=None):
+        """
+        Recompute the nutrition and cost totals as SUM(amount * value) over the recipe ingredients, in one UPDATE.
+        Ingredients without reference data do not contribute.
+        """
+        recipes = self.all() if recipe_ids is None else self.filter(id__in=recipe_ids)
+        return recipes.update(**{
+            field: Coalesce(models.Subquery(
+                IngredientAmount.objects.filter(recipe=models.OuterRef('pk')).order_by().values('recipe').annotate(
+                    total=models.Sum(models.F('amount') * models.F(f'ingredient__{source}'))
+                ).values('total'),
+                output_field=models.FloatField()
+            ), 0.0)
+            for field, source in self.totals.items()
+        })
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         to=User, verbose_name='Автор', related_name='recipes', on_delete=models.CASCADE, blank=False
@@ -50,7 +114,16 @@ class Recipe(models.Model):
     image = models.ImageField(
         upload_to='recipes/images/', verbose_name='Картинка', blank=False
     )
+    renditions_ready = models.BooleanField(
+        verbose_name='Уменьшенные копии картинки готовы', default=False, editable=False
+    )
     text = models.TextField(verbose_name='Описание', blank=False)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Кол-во добавлений в избранное', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Кол-во добавлений в список покупок', default=0, editable=False
+    )
     ingredients = models.ManyToManyField(
         to=Ingredient, verbose_name='Список ингредиентов', blank=False, through='IngredientAmount'
     )
@@ -66,17 +139,35 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации', auto_now_add=True,
     )
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Количество порций', default=1, validators=[
+            validators.MinValueValidator(1, message='Количество порций должно быть >= 1!')
+        ]
+    )
+    calories = models.FloatField(verbose_name='Ккал', default=0, editable=False)
+    proteins = models.FloatField(verbose_name='Белки, г', default=0, editable=False)
+    fats = models.FloatField(verbose_name='Жиры, г', default=0, editable=False)
+    carbohydrates = models.FloatField(verbose_name='Углеводы, г', default=0, editable=False)
+    cost = models.FloatField(verbose_name='Стоимость', default=0, editable=False)
+    # Maintained by recipes.search on PostgreSQL, where it has a GIN index; other backends keep their own index.
+    search_document = SearchVectorField(verbose_name='Поисковый документ', null=True, editable=False)
+
+    objects = RecipeManager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'name'],
                 name='unique_author_name'
             )
         ]
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return f'Рецепт "{self.name}" от {self.author}'
@@ -115,6 +206,7 @@ class Favorite(models.Model):
     recipe = models.ForeignKey(
         to=Recipe, verbose_name='Рецепт', on_delete=models.CASCADE
     )
+    created = models.DateTimeField(verbose_name='Дата добавления', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Избранное'
@@ -138,6 +230,7 @@ class ShoppingCart(models.Model):
     recipe = models.ForeignKey(
         to=Recipe, verbose_name='Рецепт', related_name='shopping_cart', on_delete=models.CASCADE
     )
+    created = models.DateTimeField(verbose_name='Дата добавления', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -152,3 +245,152 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в cписок покупок.'
+
+
+class ShoppingCartTotalManager(models.Manager):
+    def expected(self, user_ids=None):
+        lookup = (
+            {'recipe__shopping_cart__isnull': False}
+            if user_ids is None
+            else {'recipe__shopping_cart__user__in': user_ids}
+        )
+        rows = IngredientAmount.objects.filter(**lookup).values_list(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=models.Sum('amount')).order_by()
+        return {(user_id, ingredient_id): total for user_id, ingredient_id, total in rows}
+
+    @transaction.atomic
+    def apply_deltas(self, user_ids, deltas):
+        deltas = {ingredient_id: delta for ingredient_id, delta in deltas.items() if delta}
+        if not user_ids or not deltas:
+            return
+        totals = self.select_for_update().filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        existing = {(total.user_id, total.ingredient_id): total for total in totals}
+        create_totals, update_totals, delete_ids = list(), list(), list()
+        for user_id in user_ids:
+            for ingredient_id, delta in deltas.items():
+                total = existing.get((user_id, ingredient_id))
+                if total is None:
+                    if delta > 0:
+                        create_totals.append(self.model(user_id=user_id, ingredient_id=ingredient_id, amount=delta))
+                    continue
+                total.amount += delta
+                if total.amount > 0:
+                    update_totals.append(total)
+                else:
+                    delete_ids.append(total.id)
+        if delete_ids:
+            self.filter(id__in=delete_ids).delete()
+        self.bulk_update(update_totals, ['amount'])
+        self.bulk_create(create_totals)
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        return dict(IngredientAmount.objects.filter(recipe_id__in=recipe_ids).values_list(
+            'ingredient_id'
+        ).annotate(total=models.Sum('amount')).order_by())
+
+    def add_recipe(self, user_id, recipe_id):
+        self.add_recipes(user_id, [recipe_id])
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.remove_recipes(user_id, [recipe_id])
+
+    def add_recipes(self, user_id, recipe_ids):
+        self.apply_deltas([user_id], self.recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        amounts = self.recipes_amounts(recipe_ids)
+        self.apply_deltas([user_id], {ingredient_id: -amount for ingredient_id, amount in amounts.items()})
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        user_ids = list(ShoppingCart.objects.filter(recipe_id=recipe_id).values_list('user_id', flat=True))
+        deltas = {
+            ingredient_id: new_amounts.get(ingredient_id, 0) - old_amounts.get(ingredient_id, 0)
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        self.apply_deltas(user_ids, deltas)
+
+    @transaction.atomic
+    def rebuild(self, user_ids=None):
+        totals = self.all() if user_ids is None else self.filter(user_id__in=user_ids)
+        totals.delete()
+        self.bulk_create([
+            self.model(user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+            for (user_id, ingredient_id), amount in self.expected(user_ids).items()
+        ], batch_size=1000)
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        to=User, verbose_name='Пользователь', related_name='shopping_cart_totals', on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        to=Ingredient, verbose_name='Ингредиент', on_delete=models.CASCADE
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingCartTotalManager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        ordering = ('user', 'ingredient__name')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient.name} {self.amount} {self.ingredient.measurement_unit}'
+
+
+class RecipeScoreManager(models.Manager):
+    # Cart additions signal an intent to cook, so they count more than favorites.
+    weights = ((Favorite, 1.0), (ShoppingCart, 2.0))
+    # Contributions older than this many half-lives are below 0.1% and are skipped.
+    window_half_lives = 10
+
+    def expected(self, half_life_days, now=None):
+        now = now or timezone.now()
+        today = timezone.localdate(now)
+        since = now - timedelta(days=half_life_days * self.window_half_lives)
+        scores = defaultdict(float)
+        for model, weight in self.weights:
+            rows = model.objects.filter(created__gte=since).annotate(day=TruncDate('created')).values_list(
+                'recipe_id', 'day'
+            ).annotate(total=models.Count('id')).order_by()
+            for recipe_id, day, total in rows:
+                scores[recipe_id] += weight * total * 0.5 ** ((today - day).days / half_life_days)
+        return scores
+
+    @transaction.atomic
+    def recompute(self, half_life_days):
+        scores = self.expected(half_life_days)
+        self.all().delete()
+        self.bulk_create([
+            self.model(recipe_id=recipe_id, score=score) for recipe_id, score in scores.items()
+        ], batch_size=1000)
+        return len(scores)
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        to=Recipe, verbose_name='Рецепт', related_name='popularity', primary_key=True, on_delete=models.CASCADE
+    )
+    score = models.FloatField(verbose_name='Рейтинг')
+
+    objects = RecipeScoreManager()
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        ordering = ('-score',)
+        indexes = [
+            models.Index(fields=['-score', 'recipe'], name='recipe_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score:.2f}'
@@ -0,0 +1,247 @@
+import bisect
+import re
+import threading
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, connections, router
+from django.db.models import Case, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+
+from . import caches
+from .models import Ingredient, Recipe
+
+CHUNK_SIZE = 500
+WORD = re.compile(r'\w+')
+
+
+class IngredientPrefixIndex:
+    """
+    Sorted in-process index of ingredient names for backends without pattern indexes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._names = list()
+        self._ids = list()
+
+    def _load(self):
+        version = caches.get_version(caches.INGREDIENTS)
+        with self._lock:
+            if self._version != version:
+                entries = sorted(Ingredient.objects.values_list('name', 'id'))
+                self._names = [name for name, _ in entries]
+                self._ids = [obj_id for _, obj_id in entries]
+                self._version = version
+            return self._names, self._ids
+
+    def search(self, value, limit=None):
+        names, ids = self._load()
+        found = list()
+        position = bisect.bisect_left(names, value)
+        while position < len(names) and names[position].startswith(value) and (limit is None or len(found) < limit):
+            found.append(ids[position])
+            position += 1
+        for name, obj_id in zip(names, ids):
+            if limit is not None and len(found) >= limit:
+                break
+            if value in name and not name.startswith(value):
+                found.append(obj_id)
+        return found
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+def search_ingredients(queryset, value, limit=None):
+    """
+    Ingredients matching `value`: prefix matches first, then substring matches.
+
+    The queryset is left unsliced so it can still be filtered, e.g. by get_object(). `limit` caps the
+    candidates of the in-process index, which come in the same order as the result; the caller slices
+    the result to the same limit.
+    """
+    value = value.lower()
+    if connection.vendor == 'postgresql':
+        queryset = queryset.filter(name__contains=value)
+    else:
+        queryset = queryset.filter(id__in=ingredient_index.search(value, limit))
+    return queryset.annotate(
+        rank=Case(
+            When(name__startswith=value, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('rank', 'name')
+
+
+class PostgresRecipeIndex:
+    """
+    Weighted tsvector of the recipe name, ingredient names and text in the GIN-indexed Recipe.search_document.
+    """
+    gin_index = 'recipe_search_document_idx'
+
+    def create(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.gin_index} ON {Recipe._meta.db_table} USING gin (search_document)'
+        )
+
+    def drop(self, schema_editor):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {self.gin_index}')
+
+    @staticmethod
+    def _update_documents(recipes):
+        config = settings.RECIPE_SEARCH_CONFIG
+        documents = Recipe.objects.filter(pk=OuterRef('pk')).annotate(document=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(StringAgg('ingredient_list__ingredient__name', ' '), weight='B', config=config)
+            + SearchVector('text', weight='C', config=config)
+        )).values('document')
+        return recipes.update(search_document=Subquery(documents))
+
+    def update(self, using, recipe_ids):
+        self._update_documents(Recipe.objects.using(using).filter(id__in=recipe_ids))
+
+    def delete(self, using, recipe_ids):
+        # The document is deleted with the recipe row.
+        pass
+
+    def rebuild(self, using):
+        return self._update_documents(Recipe.objects.using(using).all())
+
+    def search(self, queryset, value):
+        # Prefix terms built from the words only, matching SqliteRecipeIndex and keeping tsquery syntax out.
+        terms = ' & '.join(f'{word}:*' for word in WORD.findall(value.lower()))
+        if not terms:
+            return queryset.none()
+        query = SearchQuery(terms, config=settings.RECIPE_SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(search_document=query).annotate(
+            search_rank=SearchRank(F('search_document'), query, cover_density=True)
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+
+class SqliteRecipeIndex:
+    """
+    FTS5 table keyed by the recipe id, ranked with bm25 weighted towards the name and ingredients.
+    """
+    table = 'recipes_recipe_fts'
+    documents = (
+        "SELECT r.id, r.name, coalesce(group_concat(i.name, ' '), ''), r.text "
+        "FROM recipes_recipe r "
+        "LEFT JOIN recipes_ingredientamount a ON a.recipe_id = r.id "
+        "LEFT JOIN recipes_ingredient i ON i.id = a.ingredient_id "
+        "{where} GROUP BY r.id"
+    )
+
+    def create(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+            "USING fts5(name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def drop(self, schema_editor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def update(self, using, recipe_ids):
+        self.delete(using, recipe_ids)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, ingredients, text) '
+                + self.documents.format(where=f'WHERE r.id IN ({placeholders})'),
+                recipe_ids
+            )
+
+    def delete(self, using, recipe_ids):
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', recipe_ids)
+
+    def rebuild(self, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, ingredients, text) ' + self.documents.format(where='')
+            )
+            return cursor.rowcount
+
+    def search(self, queryset, value):
+        # Every word is a quoted prefix term, so user input can not inject FTS5 query syntax.
+        terms = ' '.join(f'"{word}"*' for word in WORD.findall(value.lower()))
+        if not terms:
+            return queryset.none()
+        # bm25() only works next to MATCH, so the rank is looked up per matching recipe by its rowid.
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', (terms,))
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({self.table}, 10.0, 5.0, 1.0) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {Recipe._meta.db_table}.id',
+            (terms,),
+            output_field=FloatField()
+        )).order_by('-search_rank', '-pub_date', '-id')
+
+
+RECIPE_INDEXES = {
+    'postgresql': PostgresRecipeIndex(),
+    'sqlite': SqliteRecipeIndex(),
+}
+
+
+def _recipe_index(using):
+    using = using or router.db_for_write(Recipe)
+    return using, RECIPE_INDEXES.get(connections[using].vendor)
+
+
+def update_recipe_index(recipe_ids, using=None):
+    """
+    Rebuild the search documents of the given recipes, e.g. after their name or ingredients changed.
+    """
+    using, index = _recipe_index(using)
+    if index is None:
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        index.update(using, recipe_ids[start:start + CHUNK_SIZE])
+
+
+def delete_from_recipe_index(recipe_ids, using=None):
+    using, index = _recipe_index(using)
+    if index is None:
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        index.delete(using, recipe_ids[start:start + CHUNK_SIZE])
+
+
+def rebuild_recipe_index(using=None):
+    using, index = _recipe_index(using)
+    if index is None:
+        return 0
+    return index.rebuild(using)
+
+
+def create_recipe_index(schema_editor):
+    """
+    Create the index structures of the schema editor's backend and fill them; used by the migration.
+    """
+    index = RECIPE_INDEXES.get(schema_editor.connection.vendor)
+    if index is not None:
+        index.create(schema_editor)
+        index.rebuild(schema_editor.connection.alias)
+
+
+def drop_recipe_index(schema_editor):
+    index = RECIPE_INDEXES.get(schema_editor.connection.vendor)
+    if index is not None:
+        index.drop(schema_editor)
+
+
+def search_recipes(queryset, value):
+    """
+    Recipes matching every word of `value`, the most relevant first.
+    """
+    index = RECIPE_INDEXES.get(connections[queryset.db].vendor)
+    if index is None:
+        return queryset.filter(Q(name__icontains=value) | Q(text__icontains=value))
+    return index.search(queryset, value)
@@ -0,0 +1,174 @@
+import itertools
+import random
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from users.models import Subscription
+
+from .models import Favorite, Ingredient, IngredientAmount, Recipe, ShoppingCart, ShoppingCartTotal, Tag
+from .search import update_recipe_index
+
+User = get_user_model()
+
+PREFIX = 'seed'
+UNITS = ('г', 'мл', 'шт', 'ст. л.', 'ч. л.')
+DISHES = ('суп', 'салат', 'пирог', 'каша', 'рагу', 'омлет', 'паста', 'плов', 'запеканка', 'котлеты')
+STYLES = ('домашний', 'быстрый', 'острый', 'постный', 'летний', 'праздничный', 'сытный', 'лёгкий')
+BATCH_SIZE = 1000
+
+
+class Seeder:
+    """
+    Synthetic users, recipes and relations with Zipf-skewed popularity, reproducible for a given random seed.
+
+    Relations are inserted with bulk_create, so the counters, shopping cart totals and search index
+    are filled here instead of by the signals.
+    """
+    def __init__(self, users=100, recipes=1000, ingredients=500, tags=8, ingredients_per_recipe=(3, 10),
+                 favorites_per_user=10, carts_per_user=3, subscriptions_per_user=5, skew=1.1, random_seed=42):
+        self.users = users
+        self.recipes = recipes
+        self.ingredients = ingredients
+        self.tags = tags
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.favorites_per_user = favorites_per_user
+        self.carts_per_user = carts_per_user
+        self.subscriptions_per_user = subscriptions_per_user
+        self.skew = skew
+        self.random = random.Random(random_seed)
+
+    def zipf(self, population):
+        """
+        Shuffle the population and return it with cumulative Zipf weights, so popularity is not tied to ids.
+        """
+        population = list(population)
+        self.random.shuffle(population)
+        weights = itertools.accumulate(1 / rank ** self.skew for rank in range(1, len(population) + 1))
+        return population, list(weights)
+
+    def pick(self, population, cum_weights, count, exclude=None):
+        count = min(count, len(population) - (exclude is not None))
+        picked = set()
+        for _ in range(count * 10):
+            if len(picked) >= count:
+                break
+            choice = self.random.choices(population, cum_weights=cum_weights)[0]
+            if choice != exclude:
+                picked.add(choice)
+        return picked
+
+    def around(self, average):
+        return self.random.randint(0, 2 * average) if average else 0
+
+    @transaction.atomic
+    def run(self):
+        offset = User.objects.count()
+        tag_ids = self.seed_tags()
+        ingredient_ids = self.seed_ingredients()
+
+        authors, author_weights = self.zipf(range(self.users))
+        recipe_authors = [self.random.choices(authors, cum_weights=author_weights)[0] for _ in range(self.recipes)]
+        recipes_count = Counter(recipe_authors)
+        User.objects.bulk_create([
+            User(
+                username=f'{PREFIX}-{offset + i}', email=f'{PREFIX}-{offset + i}@example.com',
+                first_name='Seed', last_name=f'User {offset + i}', recipes_count=recipes_count.get(i, 0)
+            )
+            for i in range(self.users)
+        ], batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.filter(
+            username__in=[f'{PREFIX}-{offset + i}' for i in range(self.users)]
+        ).order_by('id').values_list('id', flat=True))
+
+        recipes, recipe_weights = self.zipf(range(self.recipes))
+        favorites = {
+            user: self.pick(recipes, recipe_weights, self.around(self.favorites_per_user)) for user in range(self.users)
+        }
+        carts = {
+            user: self.pick(recipes, recipe_weights, self.around(self.carts_per_user)) for user in range(self.users)
+        }
+        favorites_count = dict.fromkeys(range(self.recipes), 0)
+        in_carts_count = dict.fromkeys(range(self.recipes), 0)
+        for user in range(self.users):
+            for recipe in favorites[user]:
+                favorites_count[recipe] += 1
+            for recipe in carts[user]:
+                in_carts_count[recipe] += 1
+
+        Recipe.objects.bulk_create([
+            Recipe(
+                author_id=user_ids[recipe_authors[i]], image='recipes/images/seed.png',
+                name=f'{PREFIX} {offset}-{i} {self.random.choice(DISHES)} {self.random.choice(STYLES)}',
+                text='Синтетический рецепт.', cooking_time=self.random.randint(5, 180),
+                servings=self.random.randint(1, 8),
+                favorites_count=favorites_count[i], in_carts_count=in_carts_count[i]
+            )
+            for i in range(self.recipes)
+        ], batch_size=BATCH_SIZE)
+        seeded_recipes = Recipe.objects.filter(name__startswith=f'{PREFIX} {offset}-')
+        recipe_ids = list(seeded_recipes.order_by('id').values_list('id', flat=True))
+
+        low, high = self.ingredients_per_recipe
+        IngredientAmount.objects.bulk_create([
+            IngredientAmount(recipe_id=recipe_id, ingredient_id=ingredient_id, amount=self.random.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in self.random.sample(
+                ingredient_ids, min(self.random.randint(low, high), len(ingredient_ids))
+            )
+        ], batch_size=BATCH_SIZE)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.random.sample(tag_ids, min(self.random.randint(1, 3), len(tag_ids)))
+        ], batch_size=BATCH_SIZE)
+        Favorite.objects.bulk_create([
+            Favorite(user_id=user_ids[user], recipe_id=recipe_ids[recipe])
+            for user, picked in favorites.items() for recipe in picked
+        ], batch_size=BATCH_SIZE)
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user_id=user_ids[user], recipe_id=recipe_ids[recipe])
+            for user, picked in carts.items() for recipe in picked
+        ], batch_size=BATCH_SIZE)
+
+        popular_authors = [author for author in authors if author in recipes_count]
+        author_weights = list(itertools.accumulate(
+            1 / rank ** self.skew for rank in range(1, len(popular_authors) + 1)
+        ))
+        Subscription.objects.bulk_create([
+            Subscription(subscriber_id=user_ids[user], author_id=user_ids[author])
+            for user in range(self.users)
+            for author in self.pick(
+                popular_authors, author_weights, self.around(self.subscriptions_per_user), exclude=user
+            )
+        ], batch_size=BATCH_SIZE)
+        ShoppingCartTotal.objects.rebuild(user_ids)
+        Recipe.objects.update_totals(seeded_recipes.values('id'))
+        update_recipe_index(recipe_ids)
+        return {
+            'users': len(user_ids),
+            'recipes': len(recipe_ids),
+            'favorites': sum(favorites_count.values()),
+            'carts': sum(in_carts_count.values()),
+        }
+
+    def seed_tags(self):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create([
+            Tag(name=f'{PREFIX} {i}', color=f'#{0xfff000 + i:06x}', slug=f'{PREFIX}-{i}')
+            for i in range(existing, self.tags)
+        ])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def seed_ingredients(self):
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create([
+            Ingredient(
+                name=f'{PREFIX} ингредиент {i}', measurement_unit=UNITS[i % len(UNITS)],
+                calories=round(self.random.uniform(0, 9), 2), proteins=round(self.random.uniform(0, 0.3), 3),
+                fats=round(self.random.uniform(0, 0.5), 3), carbohydrates=round(self.random.uniform(0, 0.8), 3),
+                price=round(self.random.uniform(0.01, 2), 2)
+            )
+            for i in range(existing, self.ingredients)
+        ], ignore_conflicts=True)
+        return list(Ingredient.objects.values_list('id', flat=True)[:max(self.ingredients, 1)])
@@ -0,0 +1,161 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caches, search
+from .models import Favorite, Ingredient, IngredientAmount, Recipe, ShoppingCart, ShoppingCartTotal, Tag
+
+User = get_user_model()
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+# Columns of a row as it was before the save, to take the old row out of the counters and cart totals.
+SAVED_ROW_FIELDS = {
+    Recipe: ('author_id',),
+    Favorite: ('user_id', 'recipe_id'),
+    ShoppingCart: ('user_id', 'recipe_id'),
+    IngredientAmount: ('recipe_id', 'ingredient_id', 'amount'),
+}
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    transaction.on_commit(lambda: caches.bump_version(caches.INGREDIENTS))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipe_totals(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.objects.update_totals(IngredientAmount.objects.filter(ingredient=instance).values('recipe_id'))
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        recipe_ids = list(IngredientAmount.objects.filter(ingredient=instance).values_list('recipe_id', flat=True))
+        transaction.on_commit(lambda: search.update_recipe_index(recipe_ids))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    transaction.on_commit(lambda: caches.bump_version(caches.TAGS))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    transaction.on_commit(lambda: caches.bump_recipe_version(instance.id))
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    # Deferred until commit, when the ingredients written after the recipe itself are in place too.
+    transaction.on_commit(lambda: search.update_recipe_index([instance.id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    search.delete_from_recipe_index([instance.id])
+
+
+@receiver([post_save, post_delete], sender=IngredientAmount)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    transaction.on_commit(lambda: caches.bump_recipe_version(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        transaction.on_commit(lambda: caches.bump_version(caches.TAGS))
+    else:
+        transaction.on_commit(lambda: caches.bump_recipe_version(instance.id))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=IngredientAmount)
+def remember_saved_row(sender, instance, **kwargs):
+    fields = SAVED_ROW_FIELDS[sender]
+    instance._saved_row = (
+        sender.objects.filter(pk=instance.pk).values_list(*fields).first() if instance.pk is not None else None
+    )
+
+
+def _change_counter(queryset, field, delta):
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Recipe)
+def count_saved_recipe(sender, instance, created, **kwargs):
+    saved_row = getattr(instance, '_saved_row', None)
+    if saved_row is not None:
+        author_id, = saved_row
+        if author_id == instance.author_id:
+            return
+        _change_counter(User.objects.filter(pk=author_id), 'recipes_count', -1)
+    _change_counter(User.objects.filter(pk=instance.author_id), 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    _change_counter(User.objects.filter(pk=instance.author_id), 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_added_recipe(sender, instance, created, **kwargs):
+    saved_row = getattr(instance, '_saved_row', None)
+    if saved_row is not None:
+        _, recipe_id = saved_row
+        if recipe_id == instance.recipe_id:
+            return
+        _change_counter(Recipe.objects.filter(pk=recipe_id), RECIPE_COUNTERS[sender], -1)
+    _change_counter(Recipe.objects.filter(pk=instance.recipe_id), RECIPE_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_removed_recipe(sender, instance, **kwargs):
+    _change_counter(Recipe.objects.filter(pk=instance.recipe_id), RECIPE_COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def update_cart_totals(sender, instance, created, **kwargs):
+    saved_row = getattr(instance, '_saved_row', None)
+    if saved_row == (instance.user_id, instance.recipe_id):
+        return
+    if saved_row is not None:
+        ShoppingCartTotal.objects.remove_recipe(*saved_row)
+    ShoppingCartTotal.objects.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_cart_totals(sender, instance, **kwargs):
+    ShoppingCartTotal.objects.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=IngredientAmount)
+def update_ingredient_cart_totals(sender, instance, created, **kwargs):
+    new_amounts = {instance.ingredient_id: instance.amount}
+    saved_row = getattr(instance, '_saved_row', None)
+    if saved_row is None:
+        ShoppingCartTotal.objects.change_recipe(instance.recipe_id, {}, new_amounts)
+        return
+    recipe_id, ingredient_id, amount = saved_row
+    if recipe_id == instance.recipe_id:
+        ShoppingCartTotal.objects.change_recipe(recipe_id, {ingredient_id: amount}, new_amounts)
+    else:
+        ShoppingCartTotal.objects.change_recipe(recipe_id, {ingredient_id: amount}, {})
+        ShoppingCartTotal.objects.change_recipe(instance.recipe_id, {}, new_amounts)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def remove_ingredient_cart_totals(sender, instance, **kwargs):
+    ShoppingCartTotal.objects.change_recipe(instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
@@ -0,0 +1,52 @@
+from django.db import models
+
+# Base unit -> every unit of its family with its size in base units, smallest first.
+SCALES = {
+    'г': (('мг', 0.001), ('г', 1), ('кг', 1000)),
+    'мл': (('мл', 1), ('л', 1000)),
+}
+CONVERSIONS = {unit: (base, factor) for base, scale in SCALES.items() for unit, factor in scale}
+
+
+def _unit_case(values, default, output_field):
+    return models.Case(
+        *[models.When(ingredient__measurement_unit=unit, then=models.Value(value)) for unit, value in values.items()],
+        default=default, output_field=output_field
+    )
+
+
+def normalized_totals(totals):
+    """
+    Sum ShoppingCartTotal rows per ingredient name and base unit, converting compatible units in SQL.
+    Units outside the conversion table are kept as they are.
+    """
+    base_unit = _unit_case(
+        {unit: base for unit, (base, _) in CONVERSIONS.items()},
+        models.F('ingredient__measurement_unit'), models.CharField()
+    )
+    factor = _unit_case(
+        {unit: float(factor) for unit, (_, factor) in CONVERSIONS.items()}, models.Value(1.0), models.FloatField()
+    )
+    return totals.annotate(base_unit=base_unit).values('ingredient__name', 'base_unit').annotate(
+        total=models.Sum(models.F('amount') * factor, output_field=models.FloatField())
+    ).order_by('ingredient__name', 'base_unit')
+
+
+def readable_amount(unit, amount):
+    """
+    Express an amount in the largest unit of its family that keeps it >= 1.
+    """
+    scale = SCALES.get(unit)
+    if scale:
+        unit, factor = scale[0]
+        for scale_unit, scale_factor in scale:
+            if amount >= scale_factor:
+                unit, factor = scale_unit, scale_factor
+        amount = round(amount / factor, 3)
+    return unit, int(amount) if float(amount).is_integer() else amount
+
+
+def readable(rows):
+    for row in rows:
+        unit, amount = readable_amount(row['base_unit'], row['total'])
+        yield {'ingredient__name': row['ingredient__name'], 'ingredient__measurement_unit': unit, 'amount': amount}
@@ -37,7 +37,7 @@ class UserAdmin(admin_auth.UserAdmin):
     add_form = UserCreationForm
 
     list_display = (
-        'username', 'email', 'first_name', 'last_name', 'is_staff'
+        'username', 'email', 'first_name', 'last_name', 'recipes_count', 'is_staff'
     )
     list_filter = ('email', 'username')
     fieldsets = (
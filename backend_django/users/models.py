@@ -6,6 +6,7 @@ class User(AbstractUser):
     first_name = models.CharField(verbose_name='Имя', max_length=150, blank=False)
     last_name = models.CharField(verbose_name='Фамилия', max_length=150, blank=False)
     email = models.EmailField(verbose_name='Email', blank=False, unique=True)
+    recipes_count = models.PositiveIntegerField(verbose_name='Кол-во рецептов', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Пользователь'